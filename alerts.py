@@ -0,0 +1,265 @@
+import math
+import queue
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+import requests
+
+# 支持的告警指标：
+#   cumulative    - 累计发帖数向上穿过阈值，例如"cumulative穿过250"
+#   pace          - 预测发帖数（pace）向上穿过阈值
+#   pace_ratio    - 预测发帖数与任务target的比值向上穿过阈值，例如阈值1表示"pace超过target"
+#   silence_hours - 结束前连续多少小时没有发帖
+ALERT_METRICS = ('cumulative', 'pace', 'pace_ratio', 'silence_hours')
+
+# 适用于所有跟踪任务的规则使用的索引键
+ALL_TRACKINGS = '*'
+
+
+def _parse_date(date_string):
+    return datetime.fromisoformat(date_string.replace('Z', '+00:00'))
+
+
+def pace_ratio(pace, target):
+    """预测发帖数与target的比值，target缺失或不是正数时返回None（不参与告警）"""
+    try:
+        target = float(target)
+    except (TypeError, ValueError):
+        return None
+    if pace is None or not math.isfinite(target) or target <= 0:
+        return None
+    return pace / target
+
+
+def silence_hours(daily, now=None):
+    """根据小时统计数据计算距离最后一次发帖已经过去的小时数（按小时桶的结束时间计算）"""
+    now = now or datetime.now(timezone.utc)
+    last_bucket = None
+    for hourly_data in daily:
+        if hourly_data.get('count') and hourly_data.get('date'):
+            bucket = _parse_date(hourly_data['date'])
+            if last_bucket is None or bucket > last_bucket:
+                last_bucket = bucket
+    if last_bucket is None:
+        return None
+    elapsed = (now - last_bucket).total_seconds() / 3600 - 1
+    return max(0.0, elapsed)
+
+
+class AlertEngine:
+    """告警规则引擎
+
+    规则按(跟踪任务, 指标)分组，组内按阈值排序。每次指标从previous变为current时，
+    只需二分查找出阈值落在(previous, current]区间内的规则，而不必遍历所有规则。
+    触发的告警放入队列，由后台线程投递到各个sink，慢的webhook不会阻塞数据更新。
+    """
+
+    def __init__(self, sinks=None, queue_size=10000):
+        self.sinks = list(sinks or [])
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = None
+        # (trackingId, metric) -> {'thresholds': [...], 'rules': [...], 'dirty': bool}
+        self._index = {}
+        # rule_id -> rule
+        self._rules = {}
+        # (trackingId, metric) -> 上一次观察到的值
+        self._last_values = {}
+
+    def add_rule(self, rule):
+        """添加规则，rule包含id、trackingId（None表示所有任务）、metric、threshold"""
+        if rule['metric'] not in ALERT_METRICS:
+            raise ValueError(f"不支持的告警指标: {rule['metric']}")
+        try:
+            threshold = float(rule['threshold'])
+        except (TypeError, ValueError):
+            raise ValueError(f"阈值必须是数字: {rule['threshold']!r}")
+        if not math.isfinite(threshold):
+            raise ValueError(f"阈值必须是有限的数字: {rule['threshold']!r}")
+        rule = dict(rule, threshold=threshold)
+        key = (rule.get('trackingId') or ALL_TRACKINGS, rule['metric'])
+        with self._lock:
+            if rule['id'] in self._rules:
+                self._remove(rule['id'])
+            self._rules[rule['id']] = rule
+            group = self._index.setdefault(key, {'thresholds': [], 'rules': [], 'dirty': False})
+            group['rules'].append(rule)
+            group['dirty'] = True
+        return rule
+
+    def remove_rule(self, rule_id):
+        with self._lock:
+            return self._remove(rule_id)
+
+    def _remove(self, rule_id):
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            return False
+        group = self._index[(rule.get('trackingId') or ALL_TRACKINGS, rule['metric'])]
+        group['rules'] = [r for r in group['rules'] if r['id'] != rule_id]
+        group['dirty'] = True
+        return True
+
+    def get_rules(self):
+        with self._lock:
+            return list(self._rules.values())
+
+    def _matching(self, key, previous, current):
+        group = self._index.get(key)
+        if not group:
+            return []
+        if group['dirty']:
+            group['rules'].sort(key=lambda r: r['threshold'])
+            group['thresholds'] = [r['threshold'] for r in group['rules']]
+            group['dirty'] = False
+        # 阈值 t 满足 previous < t <= current
+        start = bisect_right(group['thresholds'], previous)
+        end = bisect_right(group['thresholds'], current, lo=start)
+        return group['rules'][start:end]
+
+    def observe(self, tracking_id, metric, current, previous=None, title=None):
+        """观察指标的新值，返回并投递触发的告警；未提供previous时使用上一次观察到的值"""
+        if current is None:
+            return []
+        with self._lock:
+            last_key = (tracking_id, metric)
+            if previous is None:
+                previous = self._last_values.get(last_key)
+            self._last_values[last_key] = current
+            # 第一次观察只记录基准值，避免重启后重复告警
+            if previous is None or current <= previous:
+                return []
+            matched = self._matching((tracking_id, metric), previous, current)
+            matched += self._matching((ALL_TRACKINGS, metric), previous, current)
+
+        alerts = [{
+            'rule_id': rule['id'],
+            'tracking_id': tracking_id,
+            'title': title,
+            'metric': metric,
+            'threshold': rule['threshold'],
+            'previous': previous,
+            'current': current,
+            'triggered_at': time.time()
+        } for rule in matched]
+        for alert in alerts:
+            self._deliver(alert)
+        return alerts
+
+    def observe_stats(self, tracking_id, stats_data, previous_cumulative, title=None, end_date=None, target=None, now=None):
+        """根据一次统计数据更新，依次检查cumulative、pace、pace_ratio和silence_hours四类规则"""
+        now = now or datetime.now(timezone.utc)
+        alerts = self.observe(tracking_id, 'cumulative', stats_data.get('cumulative'), previous_cumulative, title)
+        alerts += self.observe(tracking_id, 'pace', stats_data.get('pace'), title=title)
+        alerts += self.observe(tracking_id, 'pace_ratio', pace_ratio(stats_data.get('pace'), target), title=title)
+        # 只在结束时间之前检查无发帖时长
+        if end_date and now < _parse_date(end_date):
+            hours = silence_hours(stats_data.get('daily', []), now)
+            alerts += self.observe(tracking_id, 'silence_hours', hours, title=title)
+        return alerts
+
+    def _deliver(self, alert):
+        """将告警放入投递队列，队列已满时丢弃并打印日志"""
+        if not self.sinks:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='alert-delivery', daemon=True)
+                self._worker.start()
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 告警投递队列已满，丢弃告警 #{alert['rule_id']}: {alert['tracking_id']} {alert['metric']}")
+
+    def _run(self):
+        while True:
+            alert = self._queue.get()
+            try:
+                for sink in self.sinks:
+                    try:
+                        sink(alert)
+                    except Exception as e:
+                        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 告警投递失败 {getattr(sink, '__name__', sink)}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """等待队列中的告警全部投递完成"""
+        self._queue.join()
+
+
+def log_sink(alert):
+    """将告警打印到日志"""
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 触发告警 #{alert['rule_id']}: {alert['tracking_id']} {alert['metric']} "
+          f"{alert['previous']} → {alert['current']} 穿过阈值 {alert['threshold']}")
+
+
+def make_webhook_sink(url, timeout=5):
+    """创建一个将告警以JSON POST到指定URL的投递函数"""
+    def webhook_sink(alert):
+        resp = requests.post(url, json=alert, timeout=timeout)
+        if resp.status_code >= 400:
+            raise RuntimeError(f"webhook返回状态码 {resp.status_code}")
+    return webhook_sink
+
+
+# 基准测试：10万条规则下每个变化事件的评估耗时
+if __name__ == '__main__':
+    import random
+
+    random.seed(0)
+    tracking_ids = [f'tracking-{i}' for i in range(50)]
+    rule_count = 100000
+    engine = AlertEngine()
+    rules = []
+    for rule_id in range(rule_count):
+        metric = random.choice(ALERT_METRICS)
+        rule = {
+            'id': rule_id,
+            'trackingId': random.choice(tracking_ids + [None]),
+            'metric': metric,
+            'threshold': (random.uniform(0, 24) if metric == 'silence_hours'
+                          else random.uniform(0.5, 1.5) if metric == 'pace_ratio'
+                          else random.randint(0, 1000))
+        }
+        rules.append(engine.add_rule(rule))
+
+    events = []
+    for tracking_id in tracking_ids:
+        cumulative = random.randint(0, 500)
+        for _ in range(40):
+            change = random.randint(1, 5)
+            events.append((tracking_id, cumulative, cumulative + change))
+            cumulative += change
+    # 先触发一次排序，只统计评估耗时
+    engine.observe(tracking_ids[0], 'cumulative', 1, 0)
+
+    start = time.perf_counter()
+    indexed_hits = sum(len(engine.observe(t, 'cumulative', cur, prev)) for t, prev, cur in events)
+    indexed = (time.perf_counter() - start) / len(events)
+
+    start = time.perf_counter()
+    naive_hits = 0
+    for t, prev, cur in events:
+        naive_hits += sum(1 for r in rules
+                          if r['metric'] == 'cumulative'
+                          and r['trackingId'] in (t, None)
+                          and prev < r['threshold'] <= cur)
+    naive = (time.perf_counter() - start) / len(events)
+
+    print(f"规则数: {rule_count}，变化事件数: {len(events)}，触发告警: {indexed_hits}（全量扫描: {naive_hits}）")
+    print(f"索引评估: {indexed * 1e6:.1f} µs/事件，全量扫描: {naive * 1e6:.1f} µs/事件")
+
+
+    # 慢webhook（每次投递50毫秒）只在后台线程中执行，数据更新路径上只有入队的开销
+    def slow_sink(alert):
+        time.sleep(0.05)
+
+    engine.sinks = [slow_sink]
+    start = time.perf_counter()
+    queued_hits = sum(len(engine.observe(t, 'cumulative', cur, prev)) for t, prev, cur in events)
+    queued = (time.perf_counter() - start) / len(events)
+    print(f"使用慢webhook时评估: {queued * 1e6:.1f} µs/事件，入队告警: {queued_hits}，"
+          f"同步投递预计需要: {queued_hits * 0.05:.0f} 秒")
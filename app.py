@@ -1,10 +1,36 @@
+import os
+
+# 运行模式：默认threading；设置ASYNC_MODE=gevent（需要安装gevent）时定时任务、requests和SSE/WebSocket的空闲连接
+# 都使用协程，不再每个连接占用一个线程。gevent模式必须在导入其他模块之前给标准库打补丁
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif ASYNC_MODE != 'threading':
+    print(f"不支持的ASYNC_MODE: {ASYNC_MODE}，使用threading模式")
+    ASYNC_MODE = 'threading'
+
 # 导入Flask模块
-from flask import Flask, render_template, jsonify
+import time
+
+# 记录进程启动时间，用于统计首次有效响应的耗时
+process_start_time = time.time()
+
+from flask import Flask, render_template, jsonify, request, Response
 from flask_apscheduler import APScheduler
 from flask_socketio import SocketIO, emit
 from database import get_all_trackings, get_tracking_stats, get_stats_summary, get_incomplete_trackings, insert_or_update_stats, insert_or_update_tracking
+from database import init_db, insert_alert_rule, get_alert_rules, delete_alert_rule, get_archived_tracking_ids
+from archive import archive_completed_trackings, archive_lock
+from market import update_market_prices
+from sse import EventBroadcaster
+from alerts import AlertEngine, ALERT_METRICS, log_sink, make_webhook_sink
+from profiler import profile_ingest, stage
+from datetime import datetime, timezone
+import math
+import profiler
+import snapshot
 import json
-import time
 import requests
 import sqlite3
 
@@ -24,8 +50,30 @@ scheduler = APScheduler()
 scheduler.init_app(app)
 scheduler.start()
 
-# 创建SocketIO实例
-socketio = SocketIO(app, cors_allowed_origins='*')
+# 创建SocketIO实例，显式指定模式，避免安装了gevent但未打补丁时被自动选择
+socketio = SocketIO(app, cors_allowed_origins='*', async_mode=ASYNC_MODE)
+
+# 创建SSE广播器，供无法使用WebSocket的客户端接收与data_update相同的事件
+# 使用SocketIO当前异步模式（threading/eventlet/gevent）对应的Event实现
+event_broadcaster = EventBroadcaster(create_event=socketio.server.eio.create_event)
+
+# 确保数据库表存在（包括新增的告警规则表）
+init_db()
+
+# 创建告警引擎，设置ALERT_WEBHOOK_URL时同时通过webhook投递
+alert_sinks = [log_sink]
+if os.environ.get('ALERT_WEBHOOK_URL'):
+    alert_sinks.append(make_webhook_sink(os.environ['ALERT_WEBHOOK_URL']))
+alert_engine = AlertEngine(alert_sinks)
+for rule in get_alert_rules():
+    # 跳过无法加载的规则（例如旧版本保存的非法阈值），避免应用无法启动
+    try:
+        alert_engine.add_rule(rule)
+    except ValueError as e:
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 跳过告警规则 #{rule['id']}: {e}")
+
+# 注册按比例采样的API请求性能分析（PROFILE_REQUEST_SAMPLE_RATE）
+profiler.init_app(app)
 
 # 全局变量
 global last_returned_data, update_changes
@@ -36,6 +84,48 @@ last_returned_data = {
 update_changes = []
 last_update_time = time.time()
 
+# 启动时加载上次保存的仪表盘快照，在第一次数据更新完成前直接使用
+if snapshot.load_snapshot():
+    last_update_time = snapshot.current_snapshot['data'].get('last_update_time') or last_update_time
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 已加载仪表盘快照，耗时 {time.time() - process_start_time:.3f} 秒")
+
+# 是否已经记录过首次有效响应的耗时
+first_response_logged = False
+
+# 返回仪表盘数据的端点，只有这些端点的响应才算作有效响应
+DATA_ENDPOINTS = {
+    'api_get_trackings',
+    'api_get_stats_summary',
+    'api_get_latest_data',
+    'api_get_tracking_stats',
+    'api_get_hourly_stats'
+}
+
+def get_dashboard_data():
+    """获取跟踪数据和统计摘要，优先使用内存中的快照"""
+    current = snapshot.current_snapshot
+    if current:
+        return current['data']['trackings'], current['data']['summary']
+    return get_all_trackings(), get_stats_summary()
+
+def snapshot_response(body):
+    """直接返回快照中预先序列化好的响应体"""
+    return Response(body, mimetype='application/json')
+
+def broadcast_update(update_data):
+    """通过WebSocket和SSE同时发送data_update事件"""
+    socketio.emit('data_update', update_data)
+    event_broadcaster.publish('data_update', update_data)
+
+# 记录从进程启动到第一次返回有效数据的耗时
+@app.after_request
+def log_first_response(response):
+    global first_response_logged
+    if not first_response_logged and response.status_code == 200 and request.endpoint in DATA_ENDPOINTS:
+        first_response_logged = True
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 进程启动后首次有效响应耗时 {time.time() - process_start_time:.3f} 秒: {request.path}")
+    return response
+
 # 定义主页路由（直接指向Elon管理界面）
 @app.route('/')
 def index():
@@ -51,30 +141,60 @@ def elon():
 # API端点：获取所有跟踪数据
 @app.route('/api/trackings')
 def api_get_trackings():
-    trackings = get_all_trackings()
-    return jsonify({'success': True, 'data': trackings})
+    current = snapshot.current_snapshot
+    if current:
+        return snapshot_response(current['responses']['trackings'])
+    with stage('sqlite'):
+        trackings = get_all_trackings()
+    with stage('json'):
+        return jsonify({'success': True, 'data': trackings})
 
 # API端点：获取特定跟踪的统计数据
 @app.route('/api/trackings/<string:tracking_id>/stats')
 def api_get_tracking_stats(tracking_id):
-    stats = get_tracking_stats(tracking_id)
+    # 默认只返回摘要字段，?include=daily 时附带小时数据
+    include_daily = 'daily' in request.args.get('include', '').split(',')
+    with stage('sqlite'):
+        stats = get_tracking_stats(tracking_id, include_daily)
     if stats:
-        return jsonify({'success': True, 'data': stats})
+        with stage('json'):
+            return jsonify({'success': True, 'data': stats})
     else:
         return jsonify({'success': False, 'message': 'Stats not found'}), 404
 
 # API端点：获取统计摘要
 @app.route('/api/stats/summary')
 def api_get_stats_summary():
-    summary = get_stats_summary()
-    return jsonify({'success': True, 'data': summary})
+    current = snapshot.current_snapshot
+    if current:
+        return snapshot_response(current['responses']['summary'])
+    with stage('sqlite'):
+        summary = get_stats_summary()
+    with stage('json'):
+        return jsonify({'success': True, 'data': summary})
 
 # API端点：获取小时级别的统计数据
 @app.route('/api/trackings/<string:tracking_id>/hourly')
 def api_get_hourly_stats(tracking_id):
+    current = snapshot.current_snapshot
+    if current and tracking_id in current['hourly']:
+        return snapshot_response(current['hourly'][tracking_id])
     from database import get_hourly_stats
-    hourly_stats = get_hourly_stats(tracking_id)
-    return jsonify({'success': True, 'data': hourly_stats})
+    with stage('sqlite'):
+        hourly_stats = get_hourly_stats(tracking_id)
+    with stage('json'):
+        return jsonify({'success': True, 'data': hourly_stats})
+
+# API端点：获取按小时对齐的发帖数与市场价格联合序列
+@app.route('/api/trackings/<string:tracking_id>/market')
+def api_get_market_series(tracking_id):
+    from database import get_market_series
+    with stage('sqlite'):
+        market_series = get_market_series(tracking_id)
+    if market_series is None:
+        return jsonify({'success': False, 'message': 'Market data not found'}), 404
+    with stage('json'):
+        return jsonify({'success': True, 'data': market_series})
 
 # API端点：获取最新更新信息
 @app.route('/api/check-updates')
@@ -86,6 +206,72 @@ def api_check_updates():
         'current_time': time.time()
     })
 
+# API端点：获取所有告警规则
+@app.route('/api/alerts')
+def api_get_alerts():
+    return jsonify({'success': True, 'data': get_alert_rules()})
+
+# API端点：添加告警规则
+@app.route('/api/alerts', methods=['POST'])
+def api_create_alert():
+    body = request.get_json(silent=True) or {}
+    metric = body.get('metric')
+    if metric not in ALERT_METRICS:
+        return jsonify({'success': False, 'message': f'metric必须是以下之一: {", ".join(ALERT_METRICS)}'}), 400
+    try:
+        threshold = float(body.get('threshold'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'threshold必须是数字'}), 400
+    if not math.isfinite(threshold):
+        return jsonify({'success': False, 'message': 'threshold必须是有限的数字'}), 400
+    
+    rule = insert_alert_rule(body.get('trackingId'), metric, threshold)
+    alert_engine.add_rule(rule)
+    return jsonify({'success': True, 'data': rule}), 201
+
+# API端点：删除告警规则
+@app.route('/api/alerts/<int:rule_id>', methods=['DELETE'])
+def api_delete_alert(rule_id):
+    if not delete_alert_rule(rule_id):
+        return jsonify({'success': False, 'message': 'Alert rule not found'}), 404
+    alert_engine.remove_rule(rule_id)
+    return jsonify({'success': True})
+
+# API端点：Server-Sent Events数据更新流，作为WebSocket的后备
+@app.route('/api/stream')
+def api_stream():
+    # 浏览器重连时会通过Last-Event-ID请求头带上最后收到的事件ID（格式为"<epoch>-<序号>"）
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId') or None
+    
+    return Response(
+        event_broadcaster.subscribe(last_event_id),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止Nginx缓冲
+        }
+    )
+
+# 管理端点：查看或开启性能分析（需要设置ADMIN_TOKEN环境变量）
+@app.route('/api/admin/profile', methods=['GET', 'POST'])
+def api_admin_profile():
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    if not admin_token or request.headers.get('X-Admin-Token') != admin_token:
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        try:
+            status = profiler.configure(
+                ingest_runs=body.get('ingest_runs'),
+                sample_rate=body.get('request_sample_rate')
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+    else:
+        status = profiler.get_status()
+    return jsonify({'success': True, 'data': status})
+
 # 全局变量，存储上次返回的数据
 last_returned_data = {
     'trackings': [],
@@ -102,8 +288,8 @@ def api_get_latest_data():
     global last_returned_data, update_changes
     try:
         # 获取所有跟踪数据和统计信息
-        current_trackings = get_all_trackings()
-        current_summary = get_stats_summary()
+        with stage('sqlite'):
+            current_trackings, current_summary = get_dashboard_data()
         
         # 检查数据是否有变化
         data_changed = False
@@ -142,7 +328,8 @@ def api_get_latest_data():
             'summary': current_summary
         }
         
-        return jsonify(return_data)
+        with stage('json'):
+            return jsonify(return_data)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -178,8 +365,7 @@ def test_websocket_update():
         print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 测试WebSocket更新发送...")
         
         # 获取最新数据
-        current_trackings = get_all_trackings()
-        current_summary = get_stats_summary()
+        current_trackings, current_summary = get_dashboard_data()
         
         # 准备更新数据
         update_data = {
@@ -191,7 +377,7 @@ def test_websocket_update():
         }
         
         # 发送更新事件
-        socketio.emit('data_update', update_data)
+        broadcast_update(update_data)
         print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 测试WebSocket更新发送成功")
         
     except Exception as socket_error:
@@ -202,7 +388,13 @@ update_changes = []
 
 # 定时任务：每30秒从外部API获取数据并更新数据库
 @scheduler.task('interval', id='update_external_data', seconds=30, misfire_grace_time=900)
+@profile_ingest
 def update_external_data():
+    # 与归档任务互斥，保证本轮读取的已归档任务ID在更新过程中不会过期
+    with archive_lock:
+        _update_external_data()
+
+def _update_external_data():
     global last_update_time, update_changes
     try:
         print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 开始从外部API获取数据...")
@@ -216,13 +408,15 @@ def update_external_data():
         
         # Step 1: 获取用户数据，提取trackings
         user_url = f'https://xtracker.polymarket.com/api/users/{user_handle}'
-        response = requests.get(user_url)
+        with stage('http'):
+            response = requests.get(user_url)
         
         if response.status_code != 200:
             print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 错误：获取用户数据失败，状态码: {response.status_code}")
             return
         
-        user_data = response.json()
+        with stage('json'):
+            user_data = response.json()
         data = user_data.get('data', user_data)  # 兼容可能结构
         
         # 提取trackings列表
@@ -237,6 +431,10 @@ def update_external_data():
         api_tracking_ids = set()
         api_active_ids = set()
         
+        # 已归档的任务不再写回热数据库
+        with stage('sqlite'):
+            archived_ids = get_archived_tracking_ids()
+        
         # 先遍历所有API返回的任务，收集ID并更新它们的基本信息和状态
         for tracking in trackings:
             tracking_id = tracking['id']
@@ -245,11 +443,14 @@ def update_external_data():
             # 收集活跃任务的ID
             if tracking.get('isActive', False):
                 api_active_ids.add(tracking_id)
+            elif tracking_id in archived_ids:
+                continue
             
             # 更新tracking表的基本信息和isActive状态
             try:
                 # 直接使用API返回的tracking数据更新数据库，包括isActive状态
-                insert_or_update_tracking(tracking)
+                with stage('sqlite'):
+                    insert_or_update_tracking(tracking)
                 print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 更新跟踪任务基本信息: {tracking_id}, isActive: {tracking.get('isActive')}")
             except Exception as e:
                 print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 更新跟踪任务基本信息时出错 {tracking_id}: {e}")
@@ -267,22 +468,28 @@ def update_external_data():
             tracking_url = f'https://xtracker.polymarket.com/api/trackings/{tracking_id}?includeStats=true'
             
             try:
-                resp = requests.get(tracking_url, timeout=10)
+                with stage('http'):
+                    resp = requests.get(tracking_url, timeout=10)
                 if resp.status_code != 200:
                     print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 错误：获取跟踪数据 {tracking_id} 失败，状态码: {resp.status_code}")
                     continue
                 
-                tracking_data = resp.json()
+                with stage('json'):
+                    tracking_data = resp.json()
                 data = tracking_data.get('data', tracking_data)  # 兼容可能结构
                 
                 # 再次更新tracking表，确保数据完整
-                insert_or_update_tracking(data)
+                with stage('sqlite'):
+                    insert_or_update_tracking(data)
                 
                 # 检查是否有stats数据
                 if 'stats' in data:
                     stats_data = data['stats']
                     # 更新stats表，并获取更新前后的cumulative值
-                    previous_cumulative, current_cumulative = insert_or_update_stats(tracking_id, stats_data)
+                    with stage('sqlite'):
+                        stored_cumulative, current_cumulative = insert_or_update_stats(tracking_id, stats_data)
+                    # 第一次出现的任务没有旧值（None），变化列表按从0开始计算，告警引擎只记录基准值
+                    previous_cumulative = stored_cumulative if stored_cumulative is not None else 0
                     
                     # 比较更新前后的值，如果不同则记录差异
                     if previous_cumulative != current_cumulative:
@@ -297,6 +504,11 @@ def update_external_data():
                         print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 跟踪任务 {tracking_id} 的cumulative值已更新: {previous_cumulative} → {current_cumulative}")
                     
                     print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 成功更新活跃跟踪任务 {tracking_id} 的统计数据")
+                    
+                    # 检查告警规则
+                    with stage('alerts'):
+                        alert_engine.observe_stats(tracking_id, stats_data, stored_cumulative,
+                                                   tracking.get('title'), data.get('endDate'), data.get('target'))
                 
             except Exception as e:
                 print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 处理跟踪任务 {tracking_id} 时出错: {e}")
@@ -307,8 +519,9 @@ def update_external_data():
         cursor = conn.cursor()
         
         # 获取数据库中所有isActive=1的任务
-        cursor.execute('SELECT id FROM polymarket_tracking WHERE isActive = 1')
-        db_active_trackings = cursor.fetchall()
+        with stage('sqlite'):
+            cursor.execute('SELECT id FROM polymarket_tracking WHERE isActive = 1')
+            db_active_trackings = cursor.fetchall()
         
         for (tracking_id,) in db_active_trackings:
             if tracking_id not in api_tracking_ids:
@@ -318,20 +531,25 @@ def update_external_data():
                 try:
                     # 调用API获取最新数据
                     tracking_url = f'https://xtracker.polymarket.com/api/trackings/{tracking_id}?includeStats=true'
-                    resp = requests.get(tracking_url, timeout=10)
+                    with stage('http'):
+                        resp = requests.get(tracking_url, timeout=10)
                     
                     if resp.status_code == 200:
-                        tracking_data = resp.json()
+                        with stage('json'):
+                            tracking_data = resp.json()
                         data = tracking_data.get('data', tracking_data)  # 兼容可能结构
                         
                         # 更新tracking表
-                        insert_or_update_tracking(data)
+                        with stage('sqlite'):
+                            insert_or_update_tracking(data)
                         print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 成功更新任务数据: {tracking_id}")
                         
                         # 如果有stats数据，更新stats表
                         if 'stats' in data:
                             stats_data = data['stats']
-                            previous_cumulative, current_cumulative = insert_or_update_stats(tracking_id, stats_data)
+                            with stage('sqlite'):
+                                stored_cumulative, current_cumulative = insert_or_update_stats(tracking_id, stats_data)
+                            previous_cumulative = stored_cumulative if stored_cumulative is not None else 0
                             if previous_cumulative != current_cumulative:
                                 has_updates = True
                                 update_changes.append({
@@ -342,6 +560,9 @@ def update_external_data():
                                     'change': current_cumulative - previous_cumulative
                                 })
                                 print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 任务 {tracking_id} 的cumulative值已更新: {previous_cumulative} → {current_cumulative}")
+                            with stage('alerts'):
+                                alert_engine.observe_stats(tracking_id, stats_data, stored_cumulative,
+                                                           data.get('title'), data.get('endDate'), data.get('target'))
                     else:
                         print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 获取任务数据失败 {tracking_id}: 状态码 {resp.status_code}")
                 except Exception as e:
@@ -352,20 +573,29 @@ def update_external_data():
                 print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 跟踪任务 {tracking_id} 已标记为非活跃")
                 has_updates = True
         
-        conn.commit()
+        with stage('sqlite'):
+            conn.commit()
         cursor.close()
         conn.close()
         
         # 只有当有实际更新时才更新时间戳
         if has_updates:
             last_update_time = time.time()
+        
+        # 保存最新的仪表盘快照，供API和重启后直接使用
+        try:
+            with stage('snapshot'):
+                snapshot.refresh_snapshot(last_update_time)
+        except Exception as snapshot_error:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 保存仪表盘快照失败: {snapshot_error}")
+        
+        if has_updates:
             print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 外部数据更新完成！发现 {len(update_changes)} 个跟踪任务的cumulative值发生变化")
             
             # 通过WebSocket发送实时更新
             try:
                 # 获取最新数据
-                current_trackings = get_all_trackings()
-                current_summary = get_stats_summary()
+                current_trackings, current_summary = get_dashboard_data()
                 
                 # 准备更新数据
                 update_data = {
@@ -377,16 +607,36 @@ def update_external_data():
                 }
                 
                 # 发送更新事件
-                socketio.emit('data_update', update_data)
+                with stage('socketio'):
+                    broadcast_update(update_data)
                 print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 通过WebSocket发送了实时数据更新")
             except Exception as socket_error:
                 print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] WebSocket发送更新失败: {socket_error}")
         else:
             print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 外部数据更新完成，没有检测到cumulative值变化")
         
+        # Step 5: 获取活跃任务对应市场各区间的价格，按小时与发帖数据对齐保存
+        try:
+            with stage('market'):
+                updated = update_market_prices([tracking for tracking in trackings if tracking['id'] in api_active_ids])
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 更新了 {updated} 个跟踪任务的市场价格")
+        except Exception as market_error:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 更新市场价格失败: {market_error}")
+        
     except Exception as e:
         print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 更新外部数据时出错: {e}")
 
+# 定时任务：每6小时将已结束的跟踪任务移动到归档数据库，保持热数据库体积稳定
+@scheduler.task('interval', id='archive_completed_trackings', hours=6, misfire_grace_time=900)
+def archive_completed_trackings_job():
+    try:
+        archive_completed_trackings()
+    except Exception as e:
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 归档已完成任务时出错: {e}")
+
+# 启动后立即执行一次数据更新，不必等待第一个30秒间隔
+scheduler.modify_job('update_external_data', next_run_time=datetime.now(timezone.utc))
+
 # SocketIO事件：客户端连接
 socketio.on('connect')
 def on_connect():
@@ -402,4 +652,6 @@ def on_disconnect():
 # 主函数
 if __name__ == '__main__':
     # 使用socketio.run()运行应用，支持WebSocket
-    socketio.run(app, host='0.0.0.0', port=8085, debug=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    # gevent模式下关闭自动重载：重载器fork子进程时会触发gevent的after_fork断言
+    socketio.run(app, host='0.0.0.0', port=8085, debug=True, use_reloader=ASYNC_MODE != 'gevent',
+                 allow_unsafe_werkzeug=True)
\ No newline at end of file
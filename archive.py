@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import database
+from database import init_db, compact_db
+
+# 任务结束多少小时后才归档，留出时间让最后一次数据更新完成
+ARCHIVE_AFTER_HOURS = float(os.environ.get('ARCHIVE_AFTER_HOURS', '24'))
+
+# 归档与数据更新互斥：数据更新在开始时读取已归档的任务ID，
+# 如果归档在更新过程中提交，本轮更新会把刚归档的任务重新写回热数据库
+archive_lock = threading.Lock()
+
+TRACKING_COLUMNS = 'id, userId, title, startDate, endDate, target, marketLink, isActive, metrics, config, createdAt, updatedAt, user'
+STATS_COLUMNS = 'trackingId, total, cumulative, previous_cumulative, pace, percentComplete, daysElapsed, daysRemaining, daysTotal, isComplete'
+
+
+def init_archive_db():
+    """初始化归档数据库，创建表"""
+    conn = sqlite3.connect(database.archive_db_path)
+    cursor = conn.cursor()
+
+    # 新建的归档数据库启用增量VACUUM（必须在建表之前设置）
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS polymarket_tracking (
+        id TEXT PRIMARY KEY,
+        userId TEXT,
+        title TEXT,
+        startDate TEXT,
+        endDate TEXT,
+        target TEXT,
+        marketLink TEXT,
+        isActive BOOLEAN,
+        metrics TEXT,
+        config TEXT,
+        createdAt TEXT,
+        updatedAt TEXT,
+        user TEXT
+    )
+    ''')
+
+    # 归档的统计数据不再保存daily，小时数据在polymarket_hourly_rollup中
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS polymarket_tracking_stats (
+        trackingId TEXT PRIMARY KEY,
+        total INTEGER,
+        cumulative INTEGER,
+        previous_cumulative INTEGER,
+        pace INTEGER,
+        percentComplete INTEGER,
+        daysElapsed INTEGER,
+        daysRemaining INTEGER,
+        daysTotal INTEGER,
+        isComplete BOOLEAN
+    )
+    ''')
+
+    # 兼容旧版本归档数据库：删除不再使用的daily列（需要SQLite 3.35以上，更早的版本保留空列）
+    cursor.execute('PRAGMA table_info(polymarket_tracking_stats)')
+    if 'daily' in [row[1] for row in cursor.fetchall()]:
+        try:
+            cursor.execute('ALTER TABLE polymarket_tracking_stats DROP COLUMN daily')
+        except sqlite3.OperationalError:
+            pass
+
+    # 按天（UTC）压缩的小时数据：counts为从startDate开始连续每小时的发帖数，以逗号分隔
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS polymarket_hourly_rollup (
+        trackingId TEXT,
+        day TEXT,
+        startDate TEXT,
+        count INTEGER,
+        cumulative INTEGER,
+        counts TEXT,
+        PRIMARY KEY (trackingId, day)
+    ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS polymarket_market_outcomes (
+        trackingId TEXT PRIMARY KEY,
+        slug TEXT,
+        labels TEXT,
+        tokenIds TEXT,
+        updatedAt TEXT
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS polymarket_market_prices (
+        trackingId TEXT,
+        statsDate TEXT,
+        prices TEXT,
+        PRIMARY KEY (trackingId, statsDate)
+    ) WITHOUT ROWID
+    ''')
+
+    conn.commit()
+    conn.close()
+
+
+def compact_hourly_stats(tracking_id, hourly_rows):
+    """将(statsDate, count, cumulative)小时数据按天压缩，缺失的小时补0"""
+    rollups = []
+    current_day = None
+    for stats_date, count, cumulative in hourly_rows:
+        dt_hour = datetime.fromisoformat(stats_date.replace('Z', '+00:00'))
+        day = dt_hour.strftime('%Y-%m-%d')
+        if current_day is None or current_day['day'] != day:
+            current_day = {'day': day, 'start': dt_hour, 'counts': [], 'cumulative': 0}
+            rollups.append(current_day)
+        offset = int((dt_hour - current_day['start']).total_seconds() // 3600)
+        current_day['counts'].extend([0] * (offset - len(current_day['counts'])))
+        current_day['counts'].append(count or 0)
+        current_day['cumulative'] = cumulative
+
+    return [(
+        tracking_id,
+        rollup['day'],
+        rollup['start'].strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        sum(rollup['counts']),
+        rollup['cumulative'],
+        ','.join(str(count) for count in rollup['counts'])
+    ) for rollup in rollups]
+
+
+def archive_completed_trackings(min_age_hours=ARCHIVE_AFTER_HOURS, now=None):
+    """将已结束的非活跃跟踪任务移动到归档数据库，返回归档的任务ID列表"""
+    with archive_lock:
+        return _archive_completed_trackings(min_age_hours, now)
+
+
+def _archive_completed_trackings(min_age_hours, now):
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(hours=min_age_hours)
+    db_path = database.db_path
+    size_before = os.path.getsize(db_path)
+
+    init_archive_db()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('ATTACH DATABASE ? AS archive', (database.archive_db_path,))
+
+    cursor.execute('SELECT id, endDate FROM main.polymarket_tracking WHERE isActive = 0')
+    tracking_ids = []
+    for tracking_id, end_date in cursor.fetchall():
+        if end_date and datetime.fromisoformat(end_date.replace('Z', '+00:00')) <= cutoff:
+            tracking_ids.append(tracking_id)
+
+    # 在同一个事务中完成复制和删除，中途失败不会丢失数据
+    try:
+        for tracking_id in tracking_ids:
+            cursor.execute('SELECT statsDate, count, cumulative FROM main.polymarket_hourly_stats WHERE trackingId = ? ORDER BY statsDate', (tracking_id,))
+            rollups = compact_hourly_stats(tracking_id, cursor.fetchall())
+
+            cursor.execute(f'INSERT OR REPLACE INTO archive.polymarket_tracking ({TRACKING_COLUMNS}) SELECT {TRACKING_COLUMNS} FROM main.polymarket_tracking WHERE id = ?', (tracking_id,))
+            cursor.execute(f'INSERT OR REPLACE INTO archive.polymarket_tracking_stats ({STATS_COLUMNS}) SELECT {STATS_COLUMNS} FROM main.polymarket_tracking_stats WHERE trackingId = ?', (tracking_id,))
+            # 热数据库中没有小时数据时（例如已归档的任务被重新写回），保留归档中已有的数据
+            if rollups:
+                cursor.execute('DELETE FROM archive.polymarket_hourly_rollup WHERE trackingId = ?', (tracking_id,))
+                cursor.executemany('''
+                INSERT INTO archive.polymarket_hourly_rollup (trackingId, day, startDate, count, cumulative, counts)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', rollups)
+
+            cursor.execute('INSERT OR REPLACE INTO archive.polymarket_market_outcomes SELECT * FROM main.polymarket_market_outcomes WHERE trackingId = ?', (tracking_id,))
+            cursor.execute('INSERT OR REPLACE INTO archive.polymarket_market_prices SELECT * FROM main.polymarket_market_prices WHERE trackingId = ?', (tracking_id,))
+
+            cursor.execute('DELETE FROM main.polymarket_market_prices WHERE trackingId = ?', (tracking_id,))
+            cursor.execute('DELETE FROM main.polymarket_market_outcomes WHERE trackingId = ?', (tracking_id,))
+            cursor.execute('DELETE FROM main.polymarket_hourly_stats WHERE trackingId = ?', (tracking_id,))
+            cursor.execute('DELETE FROM main.polymarket_tracking_stats WHERE trackingId = ?', (tracking_id,))
+            cursor.execute('DELETE FROM main.polymarket_tracking WHERE id = ?', (tracking_id,))
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 归档跟踪任务: {tracking_id}, 压缩为 {len(rollups)} 条按天数据")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    if tracking_ids:
+        compact_db()
+        # 重新归档会替换归档数据库中的旧数据，同样回收空闲页
+        compact_db(database.archive_db_path)
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 归档完成，共 {len(tracking_ids)} 个任务，热数据库大小: {size_before} → {os.path.getsize(db_path)} bytes")
+    return tracking_ids
+
+
+# 手动执行一次归档
+if __name__ == '__main__':
+    init_db()
+    archive_completed_trackings()
@@ -1,11 +1,16 @@
 import sqlite3
 import json
 import os
-from datetime import datetime
+import zlib
+from datetime import datetime, timedelta
+from urllib.parse import quote
 
 # 数据库文件路径
 db_path = 'polymarket.db'
 
+# 已完成跟踪任务的归档数据库文件路径
+archive_db_path = os.environ.get('ARCHIVE_DB_PATH', 'polymarket_archive.db')
+
 def init_db():
     """初始化数据库，创建表"""
     conn = sqlite3.connect(db_path)
@@ -43,7 +48,7 @@ def init_db():
         daysRemaining INTEGER,
         daysTotal INTEGER,
         isComplete BOOLEAN,
-        daily TEXT,
+        daily TEXT,  -- 已不再使用，小时数据只保存在polymarket_hourly_stats中
         FOREIGN KEY (trackingId) REFERENCES polymarket_tracking (id)
     )
     ''')
@@ -61,10 +66,129 @@ def init_db():
     )
     ''')
     
+    # 按跟踪任务查询小时数据时使用的索引
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_hourly_stats_tracking ON polymarket_hourly_stats (trackingId, statsDate)')
+    
+    # 创建polymarket_alert_rules表，用于存储用户定义的告警规则
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS polymarket_alert_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        trackingId TEXT,
+        metric TEXT,
+        threshold REAL,
+        createdAt TEXT
+    )
+    ''')
+    
+    # 创建polymarket_market_outcomes表，保存每个跟踪任务对应市场的区间选项
+    # labels和tokenIds只追加不重排，保证历史价格数据的顺序始终对应
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS polymarket_market_outcomes (
+        trackingId TEXT PRIMARY KEY,
+        slug TEXT,
+        labels TEXT,
+        tokenIds TEXT,
+        updatedAt TEXT
+    )
+    ''')
+    
+    # 创建polymarket_market_prices表，按小时保存各区间价格，与polymarket_hourly_stats的statsDate对齐
+    # prices为按labels顺序、以逗号分隔的万分比价格，缺失的价格为空
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS polymarket_market_prices (
+        trackingId TEXT,
+        statsDate TEXT,
+        prices TEXT,
+        PRIMARY KEY (trackingId, statsDate)
+    ) WITHOUT ROWID
+    ''')
+    
+    # 兼容旧版本数据库：补充缺少的previous_cumulative列
+    cursor.execute('PRAGMA table_info(polymarket_tracking_stats)')
+    if 'previous_cumulative' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE polymarket_tracking_stats ADD COLUMN previous_cumulative INTEGER')
+    
+    # 清除旧版本重复保存的daily JSON，小时数据以polymarket_hourly_stats为准
+    cursor.execute('UPDATE polymarket_tracking_stats SET daily = NULL WHERE daily IS NOT NULL')
+    cleared = cursor.rowcount
+    
     conn.commit()
     conn.close()
+    
+    if cleared > 0:
+        compact_db()
     print("数据库初始化完成")
 
+def compact_db(path=None):
+    """回收数据库（默认为热数据库）中的空闲页，第一次运行时转换为增量VACUUM模式"""
+    conn = sqlite3.connect(path or db_path)
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA auto_vacuum')
+    if cursor.fetchone()[0] != 2:
+        # auto_vacuum模式只能通过一次完整VACUUM切换
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+        print("数据库已切换为增量VACUUM模式")
+    else:
+        # incremental_vacuum每执行一步只释放一页，executescript会执行到结束
+        conn.executescript('PRAGMA incremental_vacuum;')
+    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+
+def dump_json(value):
+    """序列化JSON列，压缩后更小时保存为zlib压缩的BLOB，否则保存为文本"""
+    text = json.dumps(value)
+    packed = zlib.compress(text.encode('utf-8'), 9)
+    return packed if len(packed) < len(text) else text
+
+def load_json(value, default=None):
+    """读取JSON列，兼容文本和zlib压缩的BLOB"""
+    if not value:
+        return default
+    if isinstance(value, bytes):
+        value = zlib.decompress(value).decode('utf-8')
+    return json.loads(value)
+
+def connect_with_archive():
+    """打开数据库连接，归档数据库存在时以只读方式附加为archive，返回(连接, 是否已附加)"""
+    conn = sqlite3.connect(db_path, uri=True)
+    if not os.path.exists(archive_db_path):
+        return conn, False
+    conn.execute('ATTACH DATABASE ? AS archive', (f'file:{quote(os.path.abspath(archive_db_path))}?mode=ro',))
+    return conn, True
+
+def get_archived_tracking_ids():
+    """获取已归档的跟踪任务ID集合"""
+    if not os.path.exists(archive_db_path):
+        return set()
+    conn, _ = connect_with_archive()
+    try:
+        ids = {row[0] for row in conn.execute('SELECT id FROM archive.polymarket_tracking')}
+    except sqlite3.OperationalError:
+        ids = set()
+    conn.close()
+    return ids
+
+def expand_hourly_rollups(tracking_id, rollups):
+    """将归档中按天压缩的小时数据还原为与polymarket_hourly_stats相同格式的列表"""
+    hourly_stats = []
+    cumulative = 0
+    for start_date, counts in rollups:
+        dt_utc = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+        for i, count in enumerate(counts.split(',')):
+            count = int(count)
+            cumulative += count
+            dt_hour = dt_utc + timedelta(hours=i)
+            hourly_stats.append({
+                'id': None,
+                'trackingId': tracking_id,
+                'statsDate': dt_hour.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                'beijingDate': (dt_hour + timedelta(hours=8)).isoformat(),
+                'count': count,
+                'cumulative': cumulative
+            })
+    return hourly_stats
+
 def insert_or_update_tracking(tracking_data):
     """插入或更新跟踪数据"""
     conn = sqlite3.connect(db_path)
@@ -75,9 +199,9 @@ def insert_or_update_tracking(tracking_data):
     exists = cursor.fetchone() is not None
     
     # 准备数据
-    user_json = json.dumps(tracking_data.get('user', {})) if tracking_data.get('user') else None
-    metrics_json = json.dumps(tracking_data.get('metrics', {}))
-    config_json = json.dumps(tracking_data.get('config', {}))
+    user_json = dump_json(tracking_data.get('user', {})) if tracking_data.get('user') else None
+    metrics_json = dump_json(tracking_data.get('metrics', {}))
+    config_json = dump_json(tracking_data.get('config', {}))
     
     if exists:
         # 更新记录
@@ -167,14 +291,13 @@ def insert_or_update_stats(tracking_id, stats_data):
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
-    # 获取当前记录的cumulative值作为previous_cumulative
+    # 获取当前记录的cumulative值作为previous_cumulative，没有旧记录时为None
     cursor.execute('SELECT cumulative FROM polymarket_tracking_stats WHERE trackingId = ?', (tracking_id,))
     current_record = cursor.fetchone()
-    previous_cumulative = current_record[0] if current_record else 0
+    previous_cumulative = current_record[0] if current_record else None
     
-    # 准备数据
+    # 小时数据只写入polymarket_hourly_stats，不再重复保存为JSON
     daily = stats_data.get('daily', [])
-    daily_json = json.dumps(daily)
     
     # 检查记录是否存在
     exists = cursor.execute('SELECT trackingId FROM polymarket_tracking_stats WHERE trackingId = ?', (tracking_id,)).fetchone() is not None
@@ -184,7 +307,7 @@ def insert_or_update_stats(tracking_id, stats_data):
         cursor.execute('''
         UPDATE polymarket_tracking_stats
         SET total = ?, previous_cumulative = ?, cumulative = ?, pace = ?, percentComplete = ?, 
-            daysElapsed = ?, daysRemaining = ?, daysTotal = ?, isComplete = ?, daily = ?
+            daysElapsed = ?, daysRemaining = ?, daysTotal = ?, isComplete = ?
         WHERE trackingId = ?
         ''', (
             stats_data.get('total'),
@@ -196,7 +319,6 @@ def insert_or_update_stats(tracking_id, stats_data):
             stats_data.get('daysRemaining'),
             stats_data.get('daysTotal'),
             stats_data.get('isComplete'),
-            daily_json,
             tracking_id
         ))
         print(f"更新统计数据: {tracking_id}")
@@ -205,8 +327,8 @@ def insert_or_update_stats(tracking_id, stats_data):
         cursor.execute('''
         INSERT INTO polymarket_tracking_stats (
             trackingId, total, cumulative, previous_cumulative, pace, percentComplete, 
-            daysElapsed, daysRemaining, daysTotal, isComplete, daily
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            daysElapsed, daysRemaining, daysTotal, isComplete
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             tracking_id,
             stats_data.get('total'),
@@ -217,8 +339,7 @@ def insert_or_update_stats(tracking_id, stats_data):
             stats_data.get('daysElapsed'),
             stats_data.get('daysRemaining'),
             stats_data.get('daysTotal'),
-            stats_data.get('isComplete'),
-            daily_json
+            stats_data.get('isComplete')
         ))
         print(f"插入统计数据: {tracking_id}")
     
@@ -233,12 +354,31 @@ def insert_or_update_stats(tracking_id, stats_data):
     # 插入或更新小时数据
     insert_hourly_stats(tracking_id, daily)
     
-    # 返回更新前后的cumulative值用于比较
+    # 返回更新前后的cumulative值用于比较，第一次插入时更新前的值为None
     return previous_cumulative, stats_data.get('cumulative')
 
+def _row_to_tracking(row):
+    return {
+        'id': row[0],
+        'userId': row[1],
+        'title': row[2],
+        'startDate': row[3],
+        'endDate': row[4],
+        'target': row[5],
+        'marketLink': row[6],
+        'isActive': bool(row[7]),
+        'metrics': load_json(row[8], {}),
+        'config': load_json(row[9], {}),
+        'createdAt': row[10],
+        'updatedAt': row[11],
+        'user': load_json(row[12]),
+        'daysRemaining': row[13],  # 添加剩余天数
+        'isComplete': bool(row[14]) if row[14] is not None else False  # 添加完成状态
+    }
+
 def get_all_trackings():
-    """获取所有跟踪数据，活跃任务按剩余天数升序排列"""
-    conn = sqlite3.connect(db_path)
+    """获取所有跟踪数据（包括已归档的任务），活跃任务按剩余天数升序排列"""
+    conn, attached = connect_with_archive()
     cursor = conn.cursor()
     
     # 联合查询跟踪数据和统计数据，按isActive降序、daysRemaining升序排列
@@ -255,38 +395,36 @@ def get_all_trackings():
     ''')
     rows = cursor.fetchall()
     
+    # 已归档的任务都是非活跃任务，直接排在后面
+    if attached:
+        cursor.execute('''
+        SELECT t.*, s.daysRemaining, s.isComplete
+        FROM archive.polymarket_tracking t
+        LEFT JOIN archive.polymarket_tracking_stats s ON t.id = s.trackingId
+        WHERE t.id NOT IN (SELECT id FROM main.polymarket_tracking)
+        ''')
+        rows += cursor.fetchall()
+    
     # 将结果转换为字典列表
-    trackings = []
-    for row in rows:
-        tracking = {
-            'id': row[0],
-            'userId': row[1],
-            'title': row[2],
-            'startDate': row[3],
-            'endDate': row[4],
-            'target': row[5],
-            'marketLink': row[6],
-            'isActive': bool(row[7]),
-            'metrics': json.loads(row[8]) if row[8] else {},
-            'config': json.loads(row[9]) if row[9] else {},
-            'createdAt': row[10],
-            'updatedAt': row[11],
-            'user': json.loads(row[12]) if row[12] else None,
-            'daysRemaining': row[13],  # 添加剩余天数
-            'isComplete': bool(row[14]) if row[14] is not None else False  # 添加完成状态
-        }
-        trackings.append(tracking)
+    trackings = [_row_to_tracking(row) for row in rows]
     
     conn.close()
     return trackings
 
-def get_tracking_stats(tracking_id):
-    """获取特定跟踪的统计数据"""
-    conn = sqlite3.connect(db_path)
+def get_tracking_stats(tracking_id, include_daily=False):
+    """获取特定跟踪的统计数据，热库中不存在时从归档数据库读取；include_daily为True时附带小时数据"""
+    conn, attached = connect_with_archive()
     cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM polymarket_tracking_stats WHERE trackingId = ?', (tracking_id,))
+    columns = 'trackingId, total, cumulative, pace, percentComplete, daysElapsed, daysRemaining, daysTotal, isComplete'
+    cursor.execute(f'SELECT {columns} FROM polymarket_tracking_stats WHERE trackingId = ?', (tracking_id,))
     row = cursor.fetchone()
+    archived = False
+    
+    if row is None and attached:
+        cursor.execute(f'SELECT {columns} FROM archive.polymarket_tracking_stats WHERE trackingId = ?', (tracking_id,))
+        row = cursor.fetchone()
+        archived = True
     
     if row:
         stats = {
@@ -298,9 +436,23 @@ def get_tracking_stats(tracking_id):
             'daysElapsed': row[5],
             'daysRemaining': row[6],
             'daysTotal': row[7],
-            'isComplete': bool(row[8]),
-            'daily': json.loads(row[9]) if row[9] else []
+            'isComplete': bool(row[8])
         }
+        
+        # 小时数据以polymarket_hourly_stats（归档任务为按天压缩的数据）为准
+        if include_daily:
+            if archived:
+                cursor.execute('SELECT startDate, counts FROM archive.polymarket_hourly_rollup WHERE trackingId = ? ORDER BY day', (tracking_id,))
+                stats['daily'] = [
+                    {'date': hourly['statsDate'], 'count': hourly['count'], 'cumulative': hourly['cumulative']}
+                    for hourly in expand_hourly_rollups(tracking_id, cursor.fetchall())
+                ]
+            else:
+                cursor.execute('SELECT statsDate, count, cumulative FROM polymarket_hourly_stats WHERE trackingId = ? ORDER BY statsDate', (tracking_id,))
+                stats['daily'] = [
+                    {'date': hourly[0], 'count': hourly[1], 'cumulative': hourly[2]}
+                    for hourly in cursor.fetchall()
+                ]
     else:
         stats = None
     
@@ -309,7 +461,7 @@ def get_tracking_stats(tracking_id):
 
 def get_stats_summary():
     """获取统计摘要"""
-    conn = sqlite3.connect(db_path)
+    conn, attached = connect_with_archive()
     cursor = conn.cursor()
     
     # 获取总跟踪数
@@ -324,6 +476,19 @@ def get_stats_summary():
     cursor.execute('SELECT COUNT(*) FROM polymarket_tracking WHERE isActive = 0')
     inactive = cursor.fetchone()[0]
     
+    # 加上已归档的任务
+    if attached:
+        cursor.execute('''
+        SELECT COUNT(*), SUM(CASE WHEN isActive = 1 THEN 1 ELSE 0 END)
+        FROM archive.polymarket_tracking
+        WHERE id NOT IN (SELECT id FROM main.polymarket_tracking)
+        ''')
+        archived_total, archived_active = cursor.fetchone()
+        archived_active = archived_active or 0
+        total += archived_total
+        active += archived_active
+        inactive += archived_total - archived_active
+    
     conn.close()
     
     return {
@@ -333,13 +498,20 @@ def get_stats_summary():
     }
 
 def get_hourly_stats(tracking_id):
-    """获取特定跟踪的小时级统计数据"""
-    conn = sqlite3.connect(db_path)
+    """获取特定跟踪的小时级统计数据，热库中不存在时从归档数据库读取"""
+    conn, attached = connect_with_archive()
     cursor = conn.cursor()
     
     cursor.execute('SELECT * FROM polymarket_hourly_stats WHERE trackingId = ? ORDER BY statsDate', (tracking_id,))
     rows = cursor.fetchall()
     
+    if not rows and attached:
+        cursor.execute('SELECT startDate, counts FROM archive.polymarket_hourly_rollup WHERE trackingId = ? ORDER BY day', (tracking_id,))
+        rollups = cursor.fetchall()
+        if rollups:
+            conn.close()
+            return expand_hourly_rollups(tracking_id, rollups)
+    
     # 将结果转换为字典列表
     hourly_stats = []
     for row in rows:
@@ -382,11 +554,11 @@ def get_incomplete_trackings():
             'target': row[5],
             'marketLink': row[6],
             'isActive': bool(row[7]),
-            'metrics': json.loads(row[8]) if row[8] else {},
-            'config': json.loads(row[9]) if row[9] else {},
+            'metrics': load_json(row[8], {}),
+            'config': load_json(row[9], {}),
             'createdAt': row[10],
             'updatedAt': row[11],
-            'user': json.loads(row[12]) if row[12] else None,
+            'user': load_json(row[12]),
             'isComplete': bool(row[13]) if row[13] is not None else False
         }
         trackings.append(tracking)
@@ -394,8 +566,160 @@ def get_incomplete_trackings():
     conn.close()
     return trackings
 
+def insert_alert_rule(tracking_id, metric, threshold):
+    """插入告警规则，返回插入后的规则"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    created_at = datetime.utcnow().isoformat() + 'Z'
+    cursor.execute('''
+    INSERT INTO polymarket_alert_rules (trackingId, metric, threshold, createdAt)
+    VALUES (?, ?, ?, ?)
+    ''', (tracking_id, metric, threshold, created_at))
+    rule_id = cursor.lastrowid
+    
+    conn.commit()
+    conn.close()
+    return {
+        'id': rule_id,
+        'trackingId': tracking_id,
+        'metric': metric,
+        'threshold': threshold,
+        'createdAt': created_at
+    }
+
+def get_alert_rules():
+    """获取所有告警规则"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT id, trackingId, metric, threshold, createdAt FROM polymarket_alert_rules ORDER BY id')
+    rows = cursor.fetchall()
+    
+    rules = []
+    for row in rows:
+        rules.append({
+            'id': row[0],
+            'trackingId': row[1],
+            'metric': row[2],
+            'threshold': row[3],
+            'createdAt': row[4]
+        })
+    
+    conn.close()
+    return rules
+
+def delete_alert_rule(rule_id):
+    """删除告警规则，返回是否删除成功"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    cursor.execute('DELETE FROM polymarket_alert_rules WHERE id = ?', (rule_id,))
+    deleted = cursor.rowcount > 0
+    
+    conn.commit()
+    conn.close()
+    return deleted
+
+def get_market_outcomes(tracking_id):
+    """获取跟踪任务对应市场的区间选项，不存在时返回None"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT slug, labels, tokenIds FROM polymarket_market_outcomes WHERE trackingId = ?', (tracking_id,))
+    row = cursor.fetchone()
+    
+    conn.close()
+    if row is None:
+        return None
+    return {'slug': row[0], 'labels': load_json(row[1], []), 'tokenIds': load_json(row[2], [])}
+
+def save_market_outcomes(tracking_id, slug, outcomes):
+    """保存区间选项，新出现的区间追加到末尾，返回合并后的选项"""
+    existing = get_market_outcomes(tracking_id) or {'labels': [], 'tokenIds': []}
+    labels = list(existing['labels'])
+    token_ids = list(existing['tokenIds'])
+    for outcome in outcomes:
+        if outcome['label'] not in labels:
+            labels.append(outcome['label'])
+            token_ids.append(outcome['token_id'])
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+    INSERT OR REPLACE INTO polymarket_market_outcomes (trackingId, slug, labels, tokenIds, updatedAt)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (tracking_id, slug, dump_json(labels), dump_json(token_ids), datetime.utcnow().isoformat() + 'Z'))
+    conn.commit()
+    conn.close()
+    return {'slug': slug, 'labels': labels, 'tokenIds': token_ids}
+
+def insert_market_prices(rows):
+    """批量写入小时价格，rows为(trackingId, statsDate, prices列表)，同一小时内以最后一次价格为准"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.executemany('''
+    INSERT OR REPLACE INTO polymarket_market_prices (trackingId, statsDate, prices)
+    VALUES (?, ?, ?)
+    ''', [
+        (tracking_id, stats_date, ','.join('' if price is None else str(round(price * 10000)) for price in prices))
+        for tracking_id, stats_date, prices in rows
+    ])
+    conn.commit()
+    conn.close()
+
+def _decode_prices(labels, prices):
+    values = prices.split(',') if prices else []
+    return {
+        label: int(values[i]) / 10000
+        for i, label in enumerate(labels)
+        if i < len(values) and values[i] != ''
+    }
+
+def get_market_series(tracking_id):
+    """获取按小时对齐的发帖数与市场价格联合序列，热库中不存在时从归档数据库读取"""
+    conn, attached = connect_with_archive()
+    cursor = conn.cursor()
+    
+    schema = 'main'
+    cursor.execute('SELECT labels FROM polymarket_market_outcomes WHERE trackingId = ?', (tracking_id,))
+    row = cursor.fetchone()
+    if row is None and attached:
+        cursor.execute('SELECT labels FROM archive.polymarket_market_outcomes WHERE trackingId = ?', (tracking_id,))
+        row = cursor.fetchone()
+        schema = 'archive'
+    if row is None:
+        conn.close()
+        return None
+    labels = load_json(row[0], [])
+    
+    cursor.execute(f'SELECT statsDate, prices FROM {schema}.polymarket_market_prices WHERE trackingId = ?', (tracking_id,))
+    prices_by_hour = dict(cursor.fetchall())
+    
+    if schema == 'main':
+        cursor.execute('SELECT statsDate, beijingDate, count, cumulative FROM polymarket_hourly_stats WHERE trackingId = ? ORDER BY statsDate', (tracking_id,))
+        hourly_rows = cursor.fetchall()
+    else:
+        cursor.execute('SELECT startDate, counts FROM archive.polymarket_hourly_rollup WHERE trackingId = ? ORDER BY day', (tracking_id,))
+        hourly_rows = [
+            (hourly['statsDate'], hourly['beijingDate'], hourly['count'], hourly['cumulative'])
+            for hourly in expand_hourly_rollups(tracking_id, cursor.fetchall())
+        ]
+    conn.close()
+    
+    series = []
+    for stats_date, beijing_date, count, cumulative in hourly_rows:
+        series.append({
+            'statsDate': stats_date,
+            'beijingDate': beijing_date,
+            'count': count,
+            'cumulative': cumulative,
+            'prices': _decode_prices(labels, prices_by_hour.get(stats_date))
+        })
+    return {'labels': labels, 'series': series}
+
 # 测试数据库功能
 if __name__ == '__main__':
     init_db()
     print("数据库初始化完成")
-    print("当前统计摘要:", get_stats_summary())
\ No newline at end of file
+    print("当前统计摘要:", get_stats_summary())
@@ -835,6 +835,7 @@ let lastUpdateTime = 0;
 let updateCheckInterval = null;
 let socket = null;
 let isWebSocketConnected = false;
+let eventSource = null;
 
 // 开始实时更新检查
 function startRealtimeUpdates() {
@@ -877,13 +878,56 @@ function updateWebSocketStatus(connected) {
     if (connected) {
         statusIndicator.style.background = '#10b981'; // 绿色
         statusText.textContent = 'WebSocket 已连接';
-        // WebSocket连接成功，停止轮询
+        // WebSocket连接成功，停止轮询和SSE
         stopPolling();
+        stopEventStream();
     } else {
         statusIndicator.style.background = '#ef4444'; // 红色
         statusText.textContent = 'WebSocket 断开';
-        // WebSocket断开，启动轮询作为后备
+        // WebSocket断开，改用SSE接收更新
+        startEventStream();
+    }
+}
+
+// 启动SSE（Server-Sent Events），作为WebSocket的后备；浏览器不支持或连接出错时使用轮询
+function startEventStream() {
+    if (eventSource) {
+        return;
+    }
+    if (typeof EventSource === 'undefined') {
+        startPolling();
+        return;
+    }
+    
+    // 断线后浏览器会自动重连，并通过Last-Event-ID请求头补发错过的事件
+    eventSource = new EventSource('/api/stream');
+    
+    eventSource.addEventListener('open', () => {
+        console.log('SSE连接成功');
+        stopPolling();
+    });
+    
+    eventSource.addEventListener('data_update', (event) => {
+        console.log('通过SSE接收到数据更新');
+        handleWebSocketDataUpdate(JSON.parse(event.data));
+    });
+    
+    // 错过的事件已不在服务器缓冲区中，重新获取完整数据
+    eventSource.addEventListener('reset', async () => {
+        await handleDataUpdate();
+    });
+    
+    eventSource.addEventListener('error', () => {
+        console.error('SSE连接错误，启动轮询作为后备');
         startPolling();
+    });
+}
+
+// 停止SSE
+function stopEventStream() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
     }
 }
 
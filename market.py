@@ -0,0 +1,150 @@
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+from database import get_market_outcomes, save_market_outcomes, insert_market_prices
+
+# 市场信息（区间选项）和价格接口地址，测试时可以指向本地桩服务
+GAMMA_API_URL = os.environ.get('GAMMA_API_URL', 'https://gamma-api.polymarket.com')
+CLOB_API_URL = os.environ.get('CLOB_API_URL', 'https://clob.polymarket.com')
+
+# 每个批量价格请求最多包含的token数
+PRICE_BATCH_SIZE = int(os.environ.get('MARKET_PRICE_BATCH_SIZE', '500'))
+
+# 价格缓存时间（秒），区间选项缓存时间（秒）
+PRICE_TTL = float(os.environ.get('MARKET_PRICE_TTL', '15'))
+OUTCOME_TTL = 3600
+
+MONTHS = {
+    'jan': 'january', 'feb': 'february', 'mar': 'march', 'apr': 'april',
+    'may': 'may', 'jun': 'june', 'jul': 'july', 'aug': 'august',
+    'sep': 'september', 'oct': 'october', 'nov': 'november', 'dec': 'december'
+}
+
+# 复用HTTP连接
+session = requests.Session()
+
+# token_id -> (过期时间, 价格)
+_price_cache = {}
+# trackingId -> (过期时间, 区间选项)
+_outcome_cache = {}
+_lock = threading.Lock()
+
+
+def market_slug(title, market_link=None):
+    """获取市场的slug，优先使用marketLink，否则按照elon.js中generatePolymarketLink的规则由标题生成"""
+    if market_link:
+        match = re.search(r'/event/([^/?#]+)', market_link)
+        if match:
+            return match.group(1)
+
+    slug = title.lower()
+    slug = re.sub(r'[#?,]', '', slug)
+    slug = re.sub(r'\.+', '', slug)
+    slug = re.sub(r'\s+', '-', slug)
+    slug = re.sub(r'-+', '-', slug)
+    slug = re.sub(r'-2026$', '', slug)
+    slug = slug.replace('musk-tweets', 'musk-of-tweets', 1)
+    parts = [MONTHS.get(part, part) for part in slug.split('-')]
+    # 去掉from和to（开头的to除外）
+    parts = [part for i, part in enumerate(parts) if part not in ('from', 'to') or (part == 'to' and i == 0)]
+    return re.sub(r'-+', '-', '-'.join(parts)).strip('-')
+
+
+def _label_key(label):
+    # 按区间下限排序，"<20"这类区间排在最前面
+    numbers = re.findall(r'\d+', label)
+    return (0 if label.strip().startswith('<') else 1, int(numbers[0]) if numbers else 0, label)
+
+
+def resolve_outcomes(tracking):
+    """获取跟踪任务对应市场的区间选项（每个区间的YES token），结果会缓存"""
+    tracking_id = tracking['id']
+    now = time.time()
+    cached = _outcome_cache.get(tracking_id)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    slug = market_slug(tracking.get('title') or '', tracking.get('marketLink'))
+    resp = session.get(f'{GAMMA_API_URL}/events', params={'slug': slug}, timeout=10)
+    resp.raise_for_status()
+    events = resp.json()
+    if not events:
+        # 找不到市场时也缓存，避免每次都请求
+        outcomes = get_market_outcomes(tracking_id)
+    else:
+        found = []
+        for market in events[0].get('markets', []):
+            token_ids = market.get('clobTokenIds')
+            if isinstance(token_ids, str):
+                token_ids = json.loads(token_ids)
+            label = market.get('groupItemTitle') or market.get('question')
+            if token_ids and label:
+                found.append({'label': label, 'token_id': token_ids[0]})
+        found.sort(key=lambda outcome: _label_key(outcome['label']))
+        outcomes = save_market_outcomes(tracking_id, slug, found)
+
+    _outcome_cache[tracking_id] = (now + OUTCOME_TTL, outcomes)
+    return outcomes
+
+
+def fetch_prices(token_ids):
+    """批量获取token的中间价，已缓存且未过期的token不再请求"""
+    now = time.time()
+    prices = {}
+    missing = []
+    with _lock:
+        for token_id in token_ids:
+            cached = _price_cache.get(token_id)
+            if cached and cached[0] > now:
+                prices[token_id] = cached[1]
+            elif token_id not in missing:
+                missing.append(token_id)
+
+    for start in range(0, len(missing), PRICE_BATCH_SIZE):
+        batch = missing[start:start + PRICE_BATCH_SIZE]
+        resp = session.post(f'{CLOB_API_URL}/midpoints', json=[{'token_id': token_id} for token_id in batch], timeout=10)
+        resp.raise_for_status()
+        result = resp.json()
+        with _lock:
+            for token_id in batch:
+                price = result.get(token_id)
+                price = float(price) if price is not None else None
+                _price_cache[token_id] = (now + PRICE_TTL, price)
+                prices[token_id] = price
+    return prices
+
+
+def current_bucket(now=None):
+    """当前时间所在的小时，格式与polymarket_hourly_stats.statsDate相同"""
+    now = now or datetime.now(timezone.utc)
+    return now.strftime('%Y-%m-%dT%H:00:00.000Z')
+
+
+def update_market_prices(trackings, now=None):
+    """获取各跟踪任务所有区间的价格，合并为批量请求，写入当前小时的价格，返回更新的任务数"""
+    resolved = []
+    for tracking in trackings:
+        try:
+            outcomes = resolve_outcomes(tracking)
+        except Exception as e:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 获取市场区间失败 {tracking['id']}: {e}")
+            continue
+        if outcomes and outcomes['tokenIds']:
+            resolved.append((tracking['id'], outcomes))
+
+    if not resolved:
+        return 0
+
+    # 所有任务的token合并在一起请求，请求数只取决于token总数和批量大小
+    prices = fetch_prices([token_id for _, outcomes in resolved for token_id in outcomes['tokenIds']])
+    bucket = current_bucket(now)
+    insert_market_prices([
+        (tracking_id, bucket, [prices.get(token_id) for token_id in outcomes['tokenIds']])
+        for tracking_id, outcomes in resolved
+    ])
+    return len(resolved)
@@ -0,0 +1,202 @@
+import cProfile
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+def _env_number(name, convert, default):
+    """读取数字类型的环境变量，格式错误时打印警告并使用默认值，避免应用无法启动"""
+    value = os.environ.get(name, '').strip()
+    if not value:
+        return default
+    try:
+        return convert(value)
+    except ValueError:
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 环境变量 {name}={value!r} 格式错误，使用默认值 {default}")
+        return default
+
+
+# 性能分析文件输出目录
+profile_dir = os.environ.get('PROFILE_OUTPUT_DIR', 'profiles')
+
+# 剩余需要分析的update_external_data运行次数（环境变量PROFILE_INGEST_RUNS）
+ingest_runs_remaining = max(0, _env_number('PROFILE_INGEST_RUNS', int, 0))
+
+# API请求的采样比例，0表示关闭（环境变量PROFILE_REQUEST_SAMPLE_RATE）
+request_sample_rate = min(1.0, max(0.0, _env_number('PROFILE_REQUEST_SAMPLE_RATE', float, 0.0)))
+
+class _State(threading.local):
+    # 当前线程正在分析的运行（ingest或API请求）的分阶段耗时，未分析时为None
+    stages = None
+
+
+_state = _State()
+_lock = threading.Lock()
+
+# 是否有cProfile正在运行。Python 3.12之前同一线程上再次enable()会静默替换正在运行的分析器，
+# gevent模式下所有请求和定时任务共用一个线程，因此同一时间只允许运行一个cProfile
+_profiler_active = False
+
+# 未在分析时stage()返回的共享空上下文管理器
+_NO_STAGE = nullcontext()
+
+
+def configure(ingest_runs=None, sample_rate=None):
+    """设置接下来分析的ingest次数和API请求采样比例"""
+    global ingest_runs_remaining, request_sample_rate
+    with _lock:
+        if ingest_runs is not None:
+            ingest_runs_remaining = max(0, int(ingest_runs))
+        if sample_rate is not None:
+            request_sample_rate = min(1.0, max(0.0, float(sample_rate)))
+    return get_status()
+
+
+def get_status():
+    """获取当前的性能分析配置和已生成的文件列表"""
+    files = []
+    if os.path.isdir(profile_dir):
+        files = sorted(os.listdir(profile_dir))
+    return {
+        'ingest_runs_remaining': ingest_runs_remaining,
+        'request_sample_rate': request_sample_rate,
+        'output_dir': profile_dir,
+        'files': files
+    }
+
+
+def stage(name):
+    """记录某个阶段（http、json、sqlite、socketio等）的耗时，未在分析时返回空的上下文管理器"""
+    stages = _state.stages
+    if stages is None:
+        return _NO_STAGE
+    return _timed_stage(stages, name)
+
+
+@contextmanager
+def _timed_stage(stages, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        entry = stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+        entry['seconds'] += elapsed
+        entry['calls'] += 1
+
+
+def _dump(profiler, name, extra):
+    """将cProfile结果写入.prof文件（可用pstats、snakeviz、flameprof读取），并写入耗时明细"""
+    os.makedirs(profile_dir, exist_ok=True)
+    base = os.path.join(profile_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}")
+    profiler.dump_stats(base + '.prof')
+    with open(base + '.json', 'w') as f:
+        json.dump(extra, f, ensure_ascii=False, indent=2)
+    return base + '.prof'
+
+
+def _breakdown(name, wall, stages):
+    return {
+        'name': name,
+        'wall_seconds': wall,
+        'stages': stages,
+        'other_seconds': wall - sum(s['seconds'] for s in stages.values())
+    }
+
+
+def _start_profiler():
+    """没有其他cProfile在运行时启动一个新的分析器并返回，否则返回None"""
+    global _profiler_active
+    with _lock:
+        if _profiler_active:
+            return None
+        _profiler_active = True
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+：进程中已有其他分析工具
+        _stop_profiler(None)
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler):
+    global _profiler_active
+    if profiler is not None:
+        profiler.disable()
+    with _lock:
+        _profiler_active = False
+
+
+def _take_ingest_run():
+    global ingest_runs_remaining
+    # 未开启时不加锁，保证关闭状态下几乎没有开销
+    if ingest_runs_remaining <= 0:
+        return False
+    with _lock:
+        if ingest_runs_remaining <= 0:
+            return False
+        ingest_runs_remaining -= 1
+        return True
+
+
+def profile_ingest(func):
+    """装饰定时任务，在剩余次数大于0时使用cProfile分析本次运行"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _take_ingest_run():
+            return func(*args, **kwargs)
+
+        _state.stages = {}
+        start = time.perf_counter()
+        # 已有其他分析器在运行（例如正在分析API请求）时只记录分阶段耗时
+        profiler = _start_profiler()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                _stop_profiler(profiler)
+            wall = time.perf_counter() - start
+            extra = _breakdown(func.__name__, wall, _state.stages)
+            _state.stages = None
+            if profiler is not None:
+                path = _dump(profiler, func.__name__, extra)
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 性能分析结果已写入: {path}")
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {func.__name__} 分阶段耗时: {json.dumps(extra, ensure_ascii=False)}")
+
+    return wrapper
+
+
+def init_app(app):
+    """为Flask应用注册按比例采样的请求分析钩子，视图中的stage()同样会记录分阶段耗时"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_profile():
+        if request_sample_rate <= 0 or random.random() >= request_sample_rate:
+            return
+        # 正在分析其他请求或ingest时跳过本次采样
+        profiler = _start_profiler()
+        if profiler is None:
+            return
+        g._profiler = profiler
+        g._profile_start = time.perf_counter()
+        _state.stages = {}
+
+    @app.teardown_request
+    def _stop_request_profile(exc):
+        profiler = g.pop('_profiler', None)
+        if profiler is None:
+            return
+        _stop_profiler(profiler)
+        extra = _breakdown(request.endpoint, time.perf_counter() - g.pop('_profile_start'), _state.stages)
+        extra['path'] = request.path
+        _state.stages = None
+        try:
+            _dump(profiler, f"request-{request.endpoint}", extra)
+        except OSError as e:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 写入请求性能分析结果失败: {e}")
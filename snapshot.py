@@ -0,0 +1,111 @@
+import json
+import os
+import time
+from database import get_all_trackings, get_stats_summary, get_hourly_stats
+
+# 快照文件格式版本，格式变化时递增，旧版本文件会被忽略
+SNAPSHOT_VERSION = 1
+
+# 快照文件路径
+snapshot_path = os.environ.get('SNAPSHOT_PATH', 'dashboard_snapshot.json')
+
+# 当前内存中的快照，未加载时为None
+# 每次整体替换，读取方只需取一次引用即可得到一致的数据
+current_snapshot = None
+
+
+def _serialize(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _prepare(data):
+    """根据快照数据预先序列化各API的响应体"""
+    responses = {
+        'trackings': _serialize({'success': True, 'data': data['trackings']}),
+        'summary': _serialize({'success': True, 'data': data['summary']})
+    }
+    hourly = {
+        tracking_id: _serialize({'success': True, 'data': rows})
+        for tracking_id, rows in data['hourly'].items()
+    }
+    return {
+        'data': data,
+        'responses': responses,
+        'hourly': hourly
+    }
+
+
+def build_snapshot(last_update_time=None):
+    """从数据库生成仪表盘快照（跟踪列表、统计摘要、活跃任务的小时数据）"""
+    trackings = get_all_trackings()
+    summary = get_stats_summary()
+    hourly = {
+        tracking['id']: get_hourly_stats(tracking['id'])
+        for tracking in trackings
+        if tracking['isActive']
+    }
+    return {
+        'version': SNAPSHOT_VERSION,
+        'generated_at': time.time(),
+        'last_update_time': last_update_time,
+        'trackings': trackings,
+        'summary': summary,
+        'hourly': hourly
+    }
+
+
+def save_snapshot(data):
+    """更新内存中的快照，再写入快照文件（先写临时文件再替换，避免读到半个文件）
+
+    写文件失败（磁盘已满、目录只读等）只影响下次启动，内存中的快照仍然是最新的。
+    """
+    global current_snapshot
+    current_snapshot = _prepare(data)
+    tmp_path = snapshot_path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 写入快照文件失败: {e}")
+    return current_snapshot
+
+
+def refresh_snapshot(last_update_time=None):
+    """重新生成并保存快照"""
+    return save_snapshot(build_snapshot(last_update_time))
+
+
+def load_snapshot():
+    """启动时加载快照文件，文件不存在或版本不匹配时返回None"""
+    global current_snapshot
+    try:
+        with open(snapshot_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 读取快照文件失败: {e}")
+        return None
+
+    if data.get('version') != SNAPSHOT_VERSION:
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 快照版本不匹配: {data.get('version')}，忽略")
+        return None
+
+    current_snapshot = _prepare(data)
+    return current_snapshot
+
+
+# 对比从快照启动和冷查询数据库的耗时
+if __name__ == '__main__':
+    start = time.perf_counter()
+    snapshot = build_snapshot()
+    build_seconds = time.perf_counter() - start
+    save_snapshot(snapshot)
+    print(f"冷查询数据库生成快照耗时: {build_seconds * 1000:.2f} ms")
+
+    current_snapshot = None
+    start = time.perf_counter()
+    load_snapshot()
+    print(f"从快照文件加载耗时: {(time.perf_counter() - start) * 1000:.2f} ms")
+    print(f"快照大小: {os.path.getsize(snapshot_path)} bytes，活跃任务小时数据: {len(snapshot['hourly'])} 个")
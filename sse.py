@@ -0,0 +1,165 @@
+import json
+import sys
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+# 断线后浏览器重连前等待的毫秒数
+RETRY_MS = 3000
+
+
+def _format(event_id, event, data_json):
+    return f'id: {event_id}\nevent: {event}\ndata: {data_json}\n\n'.encode('utf-8')
+
+
+class EventBroadcaster:
+    """Server-Sent Events广播器
+
+    每个事件只序列化一次，保存到有界的重放缓冲区中，所有订阅者共享同一份字节数据。
+    订阅者在没有新事件时只是等待同一个Event对象，不占用额外的CPU；发布时唤醒所有订阅者。
+    create_event可以传入socketio.server.eio.create_event，以便在eventlet/gevent下使用协程版本的Event。
+    事件ID的格式为"<epoch>-<序号>"，epoch每次启动都不同，重启前的ID一律按缺失处理。
+    """
+
+    def __init__(self, buffer_size=100, keepalive=15, create_event=threading.Event):
+        self.keepalive = keepalive
+        self.subscribers = 0
+        self.epoch = f'{int(time.time() * 1000):x}'
+        self._buffer = deque(maxlen=buffer_size)
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._create_event = create_event
+        self._event = create_event()
+
+    def publish(self, event, data):
+        """发布事件，返回事件ID"""
+        data_json = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            self._buffer.append((event_id, _format(self._event_id(event_id), event, data_json)))
+            # 换上新的Event再唤醒旧Event上的所有订阅者
+            wake, self._event = self._event, self._create_event()
+        wake.set()
+        return self._event_id(event_id)
+
+    def _event_id(self, number):
+        return f'{self.epoch}-{number}'
+
+    def _parse_id(self, last_event_id):
+        """解析客户端的Last-Event-ID，返回本次启动中的序号；来自其他启动或格式错误时返回None"""
+        epoch, _, number = str(last_event_id).rpartition('-')
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    def _reset(self, latest):
+        return _format(self._event_id(latest), 'reset', '{}')
+
+    def _since(self, last_id):
+        """获取last_id之后的事件，返回(消息列表, 新的last_id)"""
+        with self._lock:
+            if not self._buffer:
+                return [], last_id
+            oldest = self._buffer[0][0]
+            latest = self._buffer[-1][0]
+            if last_id >= latest:
+                return [], last_id
+            if last_id < oldest - 1:
+                # 需要的事件已经不在缓冲区中，通知客户端重新获取完整数据
+                return [self._reset(latest)], latest
+            return [message for _, message in islice(self._buffer, last_id - oldest + 1, None)], latest
+
+    def subscribe(self, last_event_id=None):
+        """返回一个SSE字节流生成器
+
+        未提供last_event_id时先重放最近一个事件作为初始数据；
+        last_event_id来自其他启动、格式错误或超过当前最新ID时，先发送reset事件让客户端重新获取完整数据。
+        """
+        initial = []
+        with self._lock:
+            latest = self._next_id - 1
+            if last_event_id is None:
+                last_id = self._buffer[-1][0] - 1 if self._buffer else latest
+            else:
+                last_id = self._parse_id(last_event_id)
+                if last_id is None or last_id > latest:
+                    initial.append(self._reset(latest))
+                    last_id = latest
+
+        def stream(last_id):
+            with self._lock:
+                self.subscribers += 1
+            try:
+                yield f'retry: {RETRY_MS}\n\n'.encode('utf-8')
+                yield from initial
+                while True:
+                    # 先取得当前的Event再检查缓冲区，避免错过两者之间发布的事件
+                    event = self._event
+                    messages, last_id = self._since(last_id)
+                    if messages:
+                        yield from messages
+                        continue
+                    if not event.wait(self.keepalive):
+                        yield b': keepalive\n\n'
+            finally:
+                with self._lock:
+                    self.subscribers -= 1
+
+        return stream(last_id)
+
+
+# 连接数扩展基准：不同订阅者数量下，一次发布送达所有订阅者的耗时
+# python sse.py 使用线程作为订阅者（threading模式），python sse.py gevent 使用gevent协程（gevent worker）
+if __name__ == '__main__':
+    mode = 'gevent' if 'gevent' in sys.argv[1:] else 'threading'
+    if mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+        from gevent.event import Event as create_event
+        subscriber_counts = (100, 1000, 5000, 20000)
+    else:
+        create_event = threading.Event
+        threading.stack_size(256 * 1024)
+        subscriber_counts = (100, 1000, 5000)
+    payload = {'trackings': [{'id': f'tracking-{i}', 'title': 'x' * 60} for i in range(30)], 'summary': {'total': 30}}
+    event_count = 10
+
+    for subscriber_count in subscriber_counts:
+        broadcaster = EventBroadcaster(keepalive=60, create_event=create_event)
+        last_event = f'id: {broadcaster.epoch}-{event_count}\n'.encode()
+        received = [0]
+        delivered = threading.Condition()
+
+        def consume(stream):
+            for message in stream:
+                if message.startswith(b'id: '):
+                    with delivered:
+                        received[0] += 1
+                        delivered.notify_all()
+                    if message.startswith(last_event):
+                        break
+
+        threads = [threading.Thread(target=consume, args=(broadcaster.subscribe(),), daemon=True)
+                   for _ in range(subscriber_count)]
+        for thread in threads:
+            thread.start()
+        # 等待所有订阅者进入等待状态
+        while broadcaster.subscribers < subscriber_count:
+            time.sleep(0.01)
+        time.sleep(0.5)
+
+        latencies = []
+        for n in range(1, event_count + 1):
+            start = time.perf_counter()
+            broadcaster.publish('data_update', payload)
+            with delivered:
+                delivered.wait_for(lambda: received[0] >= n * subscriber_count, timeout=60)
+            latencies.append(time.perf_counter() - start)
+        for thread in threads:
+            thread.join(5)
+
+        average = sum(latencies) / len(latencies)
+        print(f"{mode} 订阅者: {subscriber_count}，每个事件送达全部订阅者平均耗时 {average * 1000:.1f} ms"
+              f"（每个订阅者 {average / subscriber_count * 1e6:.1f} µs），序列化次数: {event_count}")
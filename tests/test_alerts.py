@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import database
+from alerts import AlertEngine, make_webhook_sink, pace_ratio
+
+
+def start_webhook_stub(delay=0):
+    """启动本地webhook桩服务，返回(server, 收到的告警列表)"""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            time.sleep(delay)
+            length = int(self.headers.get('Content-Length', 0))
+            received.append(json.loads(self.rfile.read(length)))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+
+class AlertEngineTest(unittest.TestCase):
+    def test_only_thresholds_inside_change_fire(self):
+        engine = AlertEngine()
+        for rule_id, threshold in enumerate([100, 200, 250, 300]):
+            engine.add_rule({'id': rule_id, 'trackingId': 't1', 'metric': 'cumulative', 'threshold': threshold})
+        engine.add_rule({'id': 10, 'trackingId': None, 'metric': 'cumulative', 'threshold': 240})
+
+        alerts = engine.observe('t1', 'cumulative', 250, 200)
+        self.assertEqual(sorted(alert['threshold'] for alert in alerts), [240.0, 250.0])
+        self.assertEqual(engine.observe('t1', 'cumulative', 240, 250), [])
+
+    def test_first_observation_only_records_baseline(self):
+        engine = AlertEngine()
+        engine.add_rule({'id': 1, 'trackingId': 't1', 'metric': 'pace', 'threshold': 300})
+        self.assertEqual(engine.observe('t1', 'pace', 310), [])
+        self.assertEqual(len(engine.observe('t1', 'pace', 290)), 0)
+        self.assertEqual(len(engine.observe('t1', 'pace', 305)), 1)
+
+    def test_non_finite_threshold_rejected(self):
+        engine = AlertEngine()
+        for threshold in ('nan', 'inf', '-inf', None, 'abc'):
+            with self.assertRaises(ValueError):
+                engine.add_rule({'id': 1, 'trackingId': None, 'metric': 'cumulative', 'threshold': threshold})
+        self.assertEqual(engine.get_rules(), [])
+
+    def test_pace_ratio_uses_each_tracking_target(self):
+        engine = AlertEngine()
+        engine.add_rule({'id': 1, 'trackingId': None, 'metric': 'pace_ratio', 'threshold': 1})
+        engine.observe_stats('t1', {'cumulative': 10, 'pace': 190}, 0, target='200')
+        engine.observe_stats('t2', {'cumulative': 10, 'pace': 290}, 0, target='300')
+
+        alerts = engine.observe_stats('t1', {'cumulative': 20, 'pace': 210}, 10, target='200')
+        self.assertEqual([(alert['tracking_id'], alert['metric']) for alert in alerts], [('t1', 'pace_ratio')])
+        self.assertEqual(engine.observe_stats('t2', {'cumulative': 20, 'pace': 299}, 10, target='300'), [])
+        self.assertIsNone(pace_ratio(500, None))
+        self.assertIsNone(pace_ratio(500, '0'))
+
+    def test_webhook_delivery_does_not_block_observe(self):
+        server, received = start_webhook_stub(delay=0.3)
+        try:
+            engine = AlertEngine([make_webhook_sink(f'http://127.0.0.1:{server.server_port}/')])
+            for rule_id in range(5):
+                engine.add_rule({'id': rule_id, 'trackingId': 't1', 'metric': 'cumulative', 'threshold': 100 + rule_id})
+
+            start = time.perf_counter()
+            alerts = engine.observe('t1', 'cumulative', 110, 90, 'demo')
+            elapsed = time.perf_counter() - start
+            self.assertEqual(len(alerts), 5)
+            # 5个告警同步投递至少需要1.5秒，入队应当立即返回
+            self.assertLess(elapsed, 0.1)
+
+            engine.flush()
+            self.assertEqual(sorted(alert['rule_id'] for alert in received), [0, 1, 2, 3, 4])
+            self.assertEqual(received[0]['title'], 'demo')
+        finally:
+            server.shutdown()
+
+    def test_failing_sink_does_not_stop_delivery(self):
+        delivered = []
+
+        def broken_sink(alert):
+            raise RuntimeError('down')
+
+        engine = AlertEngine([broken_sink, delivered.append])
+        engine.add_rule({'id': 1, 'trackingId': 't1', 'metric': 'cumulative', 'threshold': 5})
+        engine.observe('t1', 'cumulative', 6, 4)
+        engine.observe('t1', 'cumulative', 8, 4)
+        engine.flush()
+        self.assertEqual(len(delivered), 2)
+
+
+class StatsBaselineTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.saved_path = database.db_path
+        database.db_path = os.path.join(self.tmp, 'alerts.db')
+        database.init_db()
+
+    def tearDown(self):
+        database.db_path = self.saved_path
+        shutil.rmtree(self.tmp)
+
+    def test_new_tracking_records_baseline_instead_of_firing(self):
+        engine = AlertEngine()
+        for rule_id, threshold in enumerate([100, 200, 300]):
+            engine.add_rule({'id': rule_id, 'trackingId': None, 'metric': 'cumulative', 'threshold': threshold})
+
+        # 第一次写入没有旧记录，不能当成从0增长到250
+        previous, current = database.insert_or_update_stats('t1', {'cumulative': 250})
+        self.assertIsNone(previous)
+        self.assertEqual(engine.observe_stats('t1', {'cumulative': current}, previous), [])
+
+        previous, current = database.insert_or_update_stats('t1', {'cumulative': 310})
+        self.assertEqual(previous, 250)
+        alerts = engine.observe_stats('t1', {'cumulative': current}, previous)
+        self.assertEqual([alert['threshold'] for alert in alerts], [300.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
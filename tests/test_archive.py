@@ -0,0 +1,120 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import archive
+import database
+
+NOW = datetime(2026, 1, 20, tzinfo=timezone.utc)
+
+TRACKING = {
+    'id': 'done-1',
+    'title': 'Elon Musk # tweets January 1 - January 8, 2026?',
+    'startDate': '2026-01-01T17:00:00.000Z',
+    'endDate': '2026-01-08T17:00:00.000Z',
+    'isActive': False
+}
+
+HOURLY = [
+    {'date': '2026-01-01T17:00:00.000Z', 'count': 3, 'cumulative': 3},
+    {'date': '2026-01-01T18:00:00.000Z', 'count': 0, 'cumulative': 3},
+    {'date': '2026-01-01T20:00:00.000Z', 'count': 4, 'cumulative': 7},
+    {'date': '2026-01-02T01:00:00.000Z', 'count': 2, 'cumulative': 9}
+]
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.saved_paths = (database.db_path, database.archive_db_path)
+        database.db_path = os.path.join(self.tmp, 'hot.db')
+        database.archive_db_path = os.path.join(self.tmp, 'archive.db')
+        database.init_db()
+        database.insert_or_update_tracking(TRACKING)
+        database.insert_or_update_stats(TRACKING['id'], {'total': 9, 'cumulative': 9, 'isComplete': True, 'daily': HOURLY})
+
+    def tearDown(self):
+        database.db_path, database.archive_db_path = self.saved_paths
+        shutil.rmtree(self.tmp)
+
+    def hourly_counts(self):
+        return [(row['statsDate'], row['count'], row['cumulative']) for row in database.get_hourly_stats(TRACKING['id'])]
+
+    def test_archive_moves_tracking_and_keeps_hourly_series(self):
+        before = self.hourly_counts()
+        self.assertEqual(archive.archive_completed_trackings(now=NOW), ['done-1'])
+
+        hot = sqlite3.connect(database.db_path)
+        self.assertEqual(hot.execute('SELECT COUNT(*) FROM polymarket_hourly_stats').fetchone()[0], 0)
+        hot.close()
+        self.assertEqual(database.get_archived_tracking_ids(), {'done-1'})
+        self.assertEqual(database.get_tracking_stats('done-1')['cumulative'], 9)
+        # 归档后补齐了缺失的小时（计数为0），累计值保持一致
+        archived = self.hourly_counts()
+        self.assertEqual([row for row in archived if row[1]], [row for row in before if row[1]])
+        self.assertEqual(archived[-1][2], 9)
+
+    def test_rearchive_without_hot_hourly_rows_keeps_rollups(self):
+        archive.archive_completed_trackings(now=NOW)
+        expected = self.hourly_counts()
+
+        # 模拟已归档的任务被重新写回热数据库，但没有小时数据
+        database.insert_or_update_tracking(TRACKING)
+        self.assertEqual(archive.archive_completed_trackings(now=NOW), ['done-1'])
+
+        self.assertEqual(self.hourly_counts(), expected)
+        self.assertEqual(database.get_tracking_stats('done-1')['cumulative'], 9)
+
+    def test_rearchive_reclaims_free_pages_in_archive(self):
+        # 200天的小时数据，每天一行压缩数据，占用多个数据页
+        start = datetime(2025, 6, 1, tzinfo=timezone.utc)
+        database.insert_hourly_stats(TRACKING['id'], [
+            {'date': (start + timedelta(hours=hour)).strftime('%Y-%m-%dT%H:%M:%S.000Z'), 'count': 12345, 'cumulative': 12345 * (hour + 1)}
+            for hour in range(200 * 24)
+        ])
+        archive.archive_completed_trackings(now=NOW)
+
+        # 重新归档时只剩一天的数据，旧的按天数据被替换
+        database.insert_or_update_tracking(TRACKING)
+        database.insert_hourly_stats(TRACKING['id'], HOURLY)
+        archive.archive_completed_trackings(now=NOW)
+
+        conn = sqlite3.connect(database.archive_db_path)
+        self.assertEqual(conn.execute('PRAGMA auto_vacuum').fetchone()[0], 2)
+        self.assertEqual(conn.execute('PRAGMA freelist_count').fetchone()[0], 0)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM polymarket_hourly_rollup').fetchone()[0], 2)
+        self.assertNotIn('daily', [row[1] for row in conn.execute('PRAGMA table_info(polymarket_tracking_stats)')])
+        conn.close()
+
+    def test_old_archive_daily_column_dropped(self):
+        conn = sqlite3.connect(database.archive_db_path)
+        conn.execute('CREATE TABLE polymarket_tracking_stats (trackingId TEXT PRIMARY KEY, total INTEGER, cumulative INTEGER, '
+                     'previous_cumulative INTEGER, pace INTEGER, percentComplete INTEGER, daysElapsed INTEGER, '
+                     'daysRemaining INTEGER, daysTotal INTEGER, isComplete BOOLEAN, daily TEXT)')
+        conn.close()
+
+        self.assertEqual(archive.archive_completed_trackings(now=NOW), ['done-1'])
+        conn = sqlite3.connect(database.archive_db_path)
+        self.assertNotIn('daily', [row[1] for row in conn.execute('PRAGMA table_info(polymarket_tracking_stats)')])
+        conn.close()
+        self.assertEqual(database.get_tracking_stats('done-1')['cumulative'], 9)
+
+    def test_archive_waits_for_ingest_lock(self):
+        result = []
+        with archive.archive_lock:
+            worker = threading.Thread(target=lambda: result.append(archive.archive_completed_trackings(now=NOW)))
+            worker.start()
+            time.sleep(0.2)
+            self.assertTrue(worker.is_alive())
+            self.assertEqual(database.get_archived_tracking_ids(), set())
+        worker.join(10)
+        self.assertEqual(result, [['done-1']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+import requests
+
+import archive
+import database
+import snapshot
+
+NOW = datetime(2026, 1, 20, tzinfo=timezone.utc)
+
+ACTIVE = {
+    'id': 'active-1',
+    'title': 'Elon Musk # tweets January 14 - January 21, 2026?',
+    'startDate': '2026-01-14T17:00:00.000Z',
+    'endDate': '2026-01-21T17:00:00.000Z',
+    'isActive': True
+}
+
+DONE = {
+    'id': 'done-1',
+    'title': 'Elon Musk # tweets January 1 - January 8, 2026?',
+    'startDate': '2026-01-01T17:00:00.000Z',
+    'endDate': '2026-01-08T17:00:00.000Z',
+    'isActive': False
+}
+
+HOURLY = [
+    {'date': '2026-01-01T17:00:00.000Z', 'count': 3, 'cumulative': 3},
+    {'date': '2026-01-01T19:00:00.000Z', 'count': 4, 'cumulative': 7}
+]
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.saved = (database.db_path, database.archive_db_path, snapshot.snapshot_path, snapshot.current_snapshot)
+        database.db_path = os.path.join(self.tmp, 'hot.db')
+        database.archive_db_path = os.path.join(self.tmp, 'archive.db')
+        snapshot.snapshot_path = os.path.join(self.tmp, 'snapshot.json')
+        snapshot.current_snapshot = None
+        database.init_db()
+        for tracking in (ACTIVE, DONE):
+            database.insert_or_update_tracking(tracking)
+            database.insert_or_update_stats(tracking['id'], {'total': 7, 'cumulative': 7, 'isComplete': not tracking['isActive'], 'daily': HOURLY})
+
+    def tearDown(self):
+        database.db_path, database.archive_db_path, snapshot.snapshot_path, snapshot.current_snapshot = self.saved
+        shutil.rmtree(self.tmp)
+
+    def execute(self, sql, params=()):
+        conn = sqlite3.connect(database.db_path)
+        rows = conn.execute(sql, params).fetchall()
+        conn.commit()
+        conn.close()
+        return rows
+
+
+class TrackingStatsTest(DatabaseTestCase):
+    def test_daily_only_included_on_request(self):
+        stats = database.get_tracking_stats('active-1')
+        self.assertEqual(stats['cumulative'], 7)
+        self.assertNotIn('daily', stats)
+
+        daily = database.get_tracking_stats('active-1', include_daily=True)['daily']
+        self.assertEqual(daily, HOURLY)
+        self.assertIsNone(database.get_tracking_stats('missing'))
+
+    def test_archived_tracking_reads_daily_from_rollups(self):
+        self.assertEqual(archive.archive_completed_trackings(now=NOW), ['done-1'])
+
+        stats = database.get_tracking_stats('done-1')
+        self.assertEqual((stats['cumulative'], stats['isComplete']), (7, True))
+        self.assertNotIn('daily', stats)
+
+        # 按天压缩的数据展开为连续的小时数据，缺失的小时计数为0
+        daily = database.get_tracking_stats('done-1', include_daily=True)['daily']
+        self.assertEqual([(hourly['date'], hourly['count']) for hourly in daily], [
+            ('2026-01-01T17:00:00.000Z', 3),
+            ('2026-01-01T18:00:00.000Z', 0),
+            ('2026-01-01T19:00:00.000Z', 4)
+        ])
+        self.assertEqual(daily[-1]['cumulative'], 7)
+
+    def test_init_db_clears_old_daily_json(self):
+        self.execute('UPDATE polymarket_tracking_stats SET daily = ? WHERE trackingId = ?', (json.dumps(HOURLY), 'active-1'))
+
+        database.init_db()
+        self.assertEqual(self.execute('SELECT daily FROM polymarket_tracking_stats WHERE trackingId = ?', ('active-1',)), [(None,)])
+        self.assertEqual(database.get_tracking_stats('active-1', include_daily=True)['daily'], HOURLY)
+
+
+class JsonColumnTest(DatabaseTestCase):
+    def test_small_values_stay_text_and_large_values_compressed(self):
+        self.assertEqual(database.dump_json({'a': 1}), '{"a": 1}')
+        metrics = {'series': [{'hour': hour, 'count': 0} for hour in range(100)]}
+        packed = database.dump_json(metrics)
+        self.assertIsInstance(packed, bytes)
+        self.assertEqual(database.load_json(packed), metrics)
+        self.assertEqual(database.load_json(None, {}), {})
+
+    def test_reads_old_text_rows_and_compressed_rows(self):
+        metrics = {'series': [{'hour': hour, 'count': 0} for hour in range(100)]}
+        database.insert_or_update_tracking(dict(ACTIVE, metrics=metrics))
+        # 旧版本以文本保存的JSON列
+        self.execute('UPDATE polymarket_tracking SET config = ?, user = ? WHERE id = ?',
+                     (json.dumps({'theme': 'dark'}), json.dumps({'name': 'elon'}), 'active-1'))
+
+        (stored_metrics, stored_config), = self.execute('SELECT metrics, config FROM polymarket_tracking WHERE id = ?', ('active-1',))
+        self.assertIsInstance(stored_metrics, bytes)
+        self.assertIsInstance(stored_config, str)
+
+        tracking = {tracking['id']: tracking for tracking in database.get_all_trackings()}['active-1']
+        self.assertEqual(tracking['metrics'], metrics)
+        self.assertEqual(tracking['config'], {'theme': 'dark'})
+        self.assertEqual(tracking['user'], {'name': 'elon'})
+
+
+class TrackingStatsEndpointTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # 导入app时会启动定时任务并立即执行一次数据更新，测试中不访问外部接口
+        patcher = mock.patch('requests.get', side_effect=requests.ConnectionError('offline'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        import app
+        app.scheduler.pause()
+        self.client = app.app.test_client()
+
+    def test_daily_only_with_include_param(self):
+        data = self.client.get('/api/trackings/active-1/stats').get_json()['data']
+        self.assertEqual(data['cumulative'], 7)
+        self.assertNotIn('daily', data)
+
+        data = self.client.get('/api/trackings/active-1/stats?include=daily').get_json()['data']
+        self.assertEqual(data['daily'], HOURLY)
+        self.assertEqual(self.client.get('/api/trackings/missing/stats').status_code, 404)
+
+    def test_archived_tracking_served_from_rollups(self):
+        archive.archive_completed_trackings(now=NOW)
+
+        data = self.client.get('/api/trackings/done-1/stats').get_json()['data']
+        self.assertNotIn('daily', data)
+        data = self.client.get('/api/trackings/done-1/stats?include=daily').get_json()['data']
+        self.assertEqual([hourly['count'] for hourly in data['daily']], [3, 0, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import database
+import market
+
+NOW = datetime(2026, 1, 5, 12, 30, tzinfo=timezone.utc)
+
+TRACKINGS = [
+    {'id': f'tracking-{i}', 'title': f'Elon Musk # tweets January {i + 1} - January {i + 8}, 2026?'}
+    for i in range(3)
+]
+
+
+def start_price_api_stub(bucket_count):
+    """启动本地的市场/价格接口桩服务，返回(server, 请求计数)"""
+    stats = {'events': 0, 'midpoints': 0, 'tokens': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            stats['events'] += 1
+            slug = parse_qs(urlparse(self.path).query).get('slug', [''])[0]
+            markets = [{
+                'groupItemTitle': f'{i * 20}-{i * 20 + 19}',
+                'clobTokenIds': json.dumps([f'{slug}-{i}-yes', f'{slug}-{i}-no'])
+            } for i in range(bucket_count)]
+            self._send([{'slug': slug, 'markets': markets}])
+
+        def do_POST(self):
+            stats['midpoints'] += 1
+            tokens = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            stats['tokens'] += len(tokens)
+            self._send({item['token_id']: '0.0125' for item in tokens})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+class MarketPriceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.saved = (database.db_path, market.GAMMA_API_URL, market.CLOB_API_URL, market.PRICE_BATCH_SIZE, market.PRICE_TTL)
+        database.db_path = os.path.join(self.tmp, 'market.db')
+        database.init_db()
+        market._outcome_cache.clear()
+        market._price_cache.clear()
+
+    def tearDown(self):
+        database.db_path, market.GAMMA_API_URL, market.CLOB_API_URL, market.PRICE_BATCH_SIZE, market.PRICE_TTL = self.saved
+        shutil.rmtree(self.tmp)
+
+    def use_stub(self, bucket_count):
+        server, stats = start_price_api_stub(bucket_count)
+        self.addCleanup(server.shutdown)
+        market.GAMMA_API_URL = market.CLOB_API_URL = f'http://127.0.0.1:{server.server_port}'
+        return stats
+
+    def test_one_price_request_per_cycle_regardless_of_bucket_count(self):
+        for bucket_count in (5, 20, 80):
+            with self.subTest(bucket_count=bucket_count):
+                market._outcome_cache.clear()
+                market._price_cache.clear()
+                stats = self.use_stub(bucket_count)
+
+                self.assertEqual(market.update_market_prices(TRACKINGS, NOW), len(TRACKINGS))
+                self.assertEqual(stats['events'], len(TRACKINGS))
+                self.assertEqual(stats['midpoints'], 1)
+                self.assertEqual(stats['tokens'], bucket_count * len(TRACKINGS))
+
+                # TTL内的第二轮不再请求市场信息和价格
+                market.update_market_prices(TRACKINGS, NOW)
+                self.assertEqual(stats['events'], len(TRACKINGS))
+                self.assertEqual(stats['midpoints'], 1)
+
+    def test_expired_prices_refetched_in_batches(self):
+        stats = self.use_stub(80)
+        market.PRICE_TTL = 0
+        market.PRICE_BATCH_SIZE = 100
+
+        market.update_market_prices(TRACKINGS, NOW)
+        self.assertEqual(stats['midpoints'], 3)
+        market.update_market_prices(TRACKINGS, NOW)
+        self.assertEqual(stats['midpoints'], 6)
+        self.assertEqual(stats['events'], len(TRACKINGS))
+
+    def test_prices_aligned_with_hourly_stats(self):
+        self.use_stub(20)
+        database.insert_hourly_stats('tracking-0', [
+            {'date': '2026-01-05T11:00:00.000Z', 'count': 2, 'cumulative': 2},
+            {'date': '2026-01-05T12:00:00.000Z', 'count': 3, 'cumulative': 5}
+        ])
+        market.update_market_prices(TRACKINGS, NOW)
+
+        series = database.get_market_series('tracking-0')
+        self.assertEqual(len(series['labels']), 20)
+        self.assertEqual(series['labels'][0], '0-19')
+        self.assertEqual(series['series'][0]['prices'], {})
+        latest = series['series'][-1]
+        self.assertEqual((latest['statsDate'], latest['cumulative']), ('2026-01-05T12:00:00.000Z', 5))
+        self.assertEqual(latest['prices']['0-19'], 0.0125)
+
+    def test_outcome_columns_stored_compressed(self):
+        self.use_stub(80)
+        market.update_market_prices(TRACKINGS[:1], NOW)
+
+        conn = sqlite3.connect(database.db_path)
+        labels, token_ids = conn.execute('SELECT labels, tokenIds FROM polymarket_market_outcomes').fetchone()
+        conn.close()
+        self.assertIsInstance(labels, bytes)
+        self.assertIsInstance(token_ids, bytes)
+        self.assertEqual(len(database.get_market_outcomes('tracking-0')['tokenIds']), 80)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import glob
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+
+import profiler
+
+
+def ingest_step_before_request():
+    return sum(range(1000))
+
+
+def ingest_step_after_request():
+    return sum(range(1000))
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.saved = (profiler.profile_dir, profiler.ingest_runs_remaining, profiler.request_sample_rate)
+        profiler.profile_dir = self.tmp
+
+        self.app = Flask(__name__)
+        profiler.init_app(self.app)
+
+        @self.app.route('/data')
+        def data():
+            with profiler.stage('sqlite'):
+                return 'ok'
+
+    def tearDown(self):
+        profiler.profile_dir, profiler.ingest_runs_remaining, profiler.request_sample_rate = self.saved
+        shutil.rmtree(self.tmp)
+
+    def profiled_functions(self, pattern):
+        paths = glob.glob(os.path.join(self.tmp, pattern))
+        self.assertEqual(len(paths), 1, paths)
+        return {function for _, _, function in pstats.Stats(paths[0]).stats}
+
+    def test_request_sampled_during_ingest_does_not_cut_ingest_profile(self):
+        # 模拟gevent模式：ingest运行过程中，同一线程上处理了一个被采样的请求
+        profiler.configure(ingest_runs=1, sample_rate=1)
+        client = self.app.test_client()
+
+        @profiler.profile_ingest
+        def update_external_data():
+            ingest_step_before_request()
+            self.assertEqual(client.get('/data').status_code, 200)
+            ingest_step_after_request()
+
+        update_external_data()
+
+        functions = self.profiled_functions('update_external_data-*.prof')
+        self.assertIn('ingest_step_before_request', functions)
+        self.assertIn('ingest_step_after_request', functions)
+        # 请求在ingest分析期间被跳过采样
+        self.assertEqual(glob.glob(os.path.join(self.tmp, 'request-*')), [])
+
+        # ingest结束后请求恢复采样，并记录分阶段耗时
+        self.assertEqual(client.get('/data').status_code, 200)
+        self.assertIn('data', self.profiled_functions('request-data-*.prof'))
+
+    def test_stage_is_shared_noop_when_not_profiling(self):
+        self.assertIs(profiler.stage('sqlite'), profiler.stage('http'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+import database
+import snapshot
+
+TRACKING = {
+    'id': 'active-1',
+    'title': 'Elon Musk # tweets January 1 - January 8, 2026?',
+    'startDate': '2026-01-01T17:00:00.000Z',
+    'endDate': '2026-01-08T17:00:00.000Z',
+    'isActive': True
+}
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.saved = (database.db_path, database.archive_db_path, snapshot.snapshot_path, snapshot.current_snapshot)
+        database.db_path = os.path.join(self.tmp, 'hot.db')
+        database.archive_db_path = os.path.join(self.tmp, 'archive.db')
+        snapshot.snapshot_path = os.path.join(self.tmp, 'snapshot.json')
+        snapshot.current_snapshot = None
+        database.init_db()
+        database.insert_or_update_tracking(TRACKING)
+        database.insert_or_update_stats(TRACKING['id'], {'cumulative': 5, 'daysRemaining': 3, 'daily': [
+            {'date': '2026-01-01T17:00:00.000Z', 'count': 5, 'cumulative': 5}
+        ]})
+
+    def tearDown(self):
+        database.db_path, database.archive_db_path, snapshot.snapshot_path, snapshot.current_snapshot = self.saved
+        shutil.rmtree(self.tmp)
+
+
+class SnapshotTest(SnapshotTestCase):
+    def test_round_trip_keeps_preserialized_bodies(self):
+        saved = snapshot.refresh_snapshot(last_update_time=100.0)
+        snapshot.current_snapshot = None
+
+        loaded = snapshot.load_snapshot()
+        self.assertEqual(loaded['responses'], saved['responses'])
+        self.assertEqual(loaded['hourly'], saved['hourly'])
+        self.assertEqual(json.loads(loaded['responses']['trackings'])['data'][0]['id'], 'active-1')
+        self.assertEqual(loaded['data']['last_update_time'], 100.0)
+
+    def test_write_failure_still_updates_memory(self):
+        snapshot.refresh_snapshot(last_update_time=100.0)
+        snapshot.load_snapshot()
+
+        snapshot.snapshot_path = os.path.join(self.tmp, 'missing', 'snapshot.json')
+        database.insert_or_update_tracking(dict(TRACKING, id='active-2'))
+        snapshot.refresh_snapshot(last_update_time=200.0)
+
+        self.assertEqual(snapshot.current_snapshot['data']['last_update_time'], 200.0)
+        self.assertEqual({t['id'] for t in snapshot.current_snapshot['data']['trackings']}, {'active-1', 'active-2'})
+
+    def test_wrong_version_or_corrupt_file_ignored(self):
+        data = snapshot.build_snapshot()
+        data['version'] = snapshot.SNAPSHOT_VERSION + 1
+        with open(snapshot.snapshot_path, 'w') as f:
+            json.dump(data, f)
+        self.assertIsNone(snapshot.load_snapshot())
+        self.assertIsNone(snapshot.current_snapshot)
+
+        with open(snapshot.snapshot_path, 'w') as f:
+            f.write('{"version": 1, "trackings": [')
+        self.assertIsNone(snapshot.load_snapshot())
+        self.assertIsNone(snapshot.current_snapshot)
+
+    def test_missing_file(self):
+        self.assertIsNone(snapshot.load_snapshot())
+
+
+class SnapshotEndpointTest(SnapshotTestCase):
+    def setUp(self):
+        super().setUp()
+        # 导入app时会启动定时任务并立即执行一次数据更新，测试中不访问外部接口
+        patcher = mock.patch('requests.get', side_effect=requests.ConnectionError('offline'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        import app
+        app.scheduler.pause()
+        self.client = app.app.test_client()
+
+    def test_trackings_served_from_snapshot_body(self):
+        prepared = snapshot.save_snapshot(dict(snapshot.build_snapshot(), summary={'total': 99, 'active': 99, 'inactive': 0}))
+
+        response = self.client.get('/api/trackings')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), prepared['responses']['trackings'])
+        self.assertEqual(self.client.get('/api/stats/summary').get_json()['data']['total'], 99)
+        self.assertEqual(self.client.get('/api/trackings/active-1/hourly').get_data(), prepared['hourly']['active-1'])
+
+    def test_falls_back_to_database_without_snapshot(self):
+        snapshot.current_snapshot = None
+        self.assertEqual(self.client.get('/api/stats/summary').get_json()['data']['total'], 1)
+        self.assertEqual(self.client.get('/api/trackings').get_json()['data'][0]['id'], 'active-1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import threading
+import unittest
+
+from sse import EventBroadcaster
+
+
+def read_event(stream):
+    """读取下一条事件（跳过retry和keepalive），返回(id, event)"""
+    for message in stream:
+        if message.startswith(b'id: '):
+            lines = message.decode('utf-8').split('\n')
+            return lines[0][len('id: '):], lines[1][len('event: '):]
+    return None
+
+
+class EventBroadcasterTest(unittest.TestCase):
+    def setUp(self):
+        self.broadcaster = EventBroadcaster(buffer_size=5, keepalive=0.05)
+
+    def publish(self, count):
+        return [self.broadcaster.publish('data_update', {'n': n}) for n in range(count)]
+
+    def test_new_subscriber_gets_latest_event_then_live_events(self):
+        ids = self.publish(3)
+        stream = self.broadcaster.subscribe()
+        self.assertEqual(read_event(stream), (ids[-1], 'data_update'))
+
+        new_id = self.broadcaster.publish('data_update', {'n': 3})
+        self.assertEqual(read_event(stream), (new_id, 'data_update'))
+        self.assertTrue(new_id.startswith(self.broadcaster.epoch + '-'))
+
+    def test_resume_replays_missed_events(self):
+        ids = self.publish(4)
+        stream = self.broadcaster.subscribe(ids[0])
+        self.assertEqual([read_event(stream)[0] for _ in range(3)], ids[1:])
+
+    def test_resume_after_gap_larger_than_buffer_resets(self):
+        ids = self.publish(8)
+        stream = self.broadcaster.subscribe(ids[0])
+        self.assertEqual(read_event(stream), (ids[-1], 'reset'))
+
+    def test_id_from_previous_boot_resets_immediately(self):
+        # 重启后计数从1开始，旧的Last-Event-ID可能比当前最新ID大得多
+        previous = EventBroadcaster()
+        previous.epoch = 'old'
+        stale_id = [previous.publish('data_update', {}) for _ in range(57)][-1]
+
+        latest_id = self.publish(2)[-1]
+        for last_event_id in (stale_id, '57', 'garbage', f'{self.broadcaster.epoch}-99'):
+            with self.subTest(last_event_id=last_event_id):
+                stream = self.broadcaster.subscribe(last_event_id)
+                self.assertEqual(read_event(stream), (latest_id, 'reset'))
+                latest_id = self.broadcaster.publish('data_update', {})
+                self.assertEqual(read_event(stream), (latest_id, 'data_update'))
+                stream.close()
+
+    def test_reset_before_first_publish(self):
+        stream = self.broadcaster.subscribe('old-3')
+        self.assertEqual(read_event(stream), (f'{self.broadcaster.epoch}-0', 'reset'))
+        new_id = self.broadcaster.publish('data_update', {})
+        self.assertEqual(read_event(stream), (new_id, 'data_update'))
+
+    def test_every_subscriber_receives_each_event_once(self):
+        subscriber_count = 50
+        event_count = 5
+        last_event = f'{self.broadcaster.epoch}-{event_count}'
+        received = [[] for _ in range(subscriber_count)]
+        ready = threading.Barrier(subscriber_count + 1)
+
+        def consume(index, stream):
+            next(stream)  # retry行
+            ready.wait()
+            while True:
+                event = read_event(stream)
+                received[index].append(event[0])
+                if event[0] == last_event:
+                    stream.close()
+                    return
+
+        streams = [self.broadcaster.subscribe() for _ in range(subscriber_count)]
+        threads = [threading.Thread(target=consume, args=(i, stream)) for i, stream in enumerate(streams)]
+        for thread in threads:
+            thread.start()
+        ready.wait()
+        ids = self.publish(event_count)
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(received, [ids] * subscriber_count)
+        self.assertEqual(self.broadcaster.subscribers, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()